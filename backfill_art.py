@@ -0,0 +1,115 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from get_cover_art.art_store import is_valid_jpeg
+from get_cover_art.cover_finder import CoverFinder, Meta
+from npart import ArtDerivatives
+from npmusicdata import MusicDataStorage
+
+# backfill_art.py fetches missing album art for every album in the music_data history,
+# e.g. after the album_images folder was lost. Art that is already in the art store is
+# skipped without a network request, and albums with no match are remembered by the
+# lookup cache, so an interrupted run can simply be started again to resume.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CODE_PATH = os.path.dirname(os.path.abspath(__file__))
+ART_PATH = os.path.join(CODE_PATH, 'album_images/')
+
+
+def has_art(finder, album):
+    '''Check the art store (and any un-indexed file) before going to the network'''
+    meta = Meta(artist=album['artists'], album=album['album'], title=album['title'])
+    key = finder.lookup_key(meta)
+    if finder.store.find_album(key[0], key[1]):
+        return True
+    if album['album_id']:
+        if finder.store.find(album['album_id']):
+            return True
+        try:
+            with open(f"{ART_PATH}{album['album_id']}.jpg", 'rb') as file:
+                return is_valid_jpeg(file.read())
+        except OSError:
+            return False
+    return False
+
+
+def backfill_album(finder, album):
+    if has_art(finder, album):
+        return "present"
+    meta = Meta(artist=album['artists'], album=album['album'], title=album['title'])
+    if finder.download(meta, ART_PATH):
+        return "fetched"
+    cached = finder.cache.get(*finder.lookup_key(meta))
+    if cached is None:
+        # a search was throttled or failed, so the album isn't known to be missing, a later run tries it again
+        return "throttled"
+    return "failed" if cached["matched"] else "missing"
+
+
+def backfill(db_name, workers):
+    if not os.path.exists(ART_PATH):
+        os.makedirs(ART_PATH)
+    # the display and screensaver sizes depend on the screen, those are generated on first use
+    derivatives = ArtDerivatives(ART_PATH)
+    finder = CoverFinder(
+        cache_path=os.path.join(CODE_PATH, 'lookup_cache.db'),
+        store_path=os.path.join(ART_PATH, 'art_index.db'),
+        on_download=lambda album_id, image_data: derivatives.generate(album_id, image_data),
+        max_wait=None # a batch job queues for the rate limit instead of giving up
+    )
+    storage = MusicDataStorage(db_name)
+    total = storage.count_albums()
+    counts = {"present": 0, "fetched": 0, "missing": 0, "throttled": 0, "failed": 0}
+    pending = {}
+    done = 0
+    start = time.time()
+    logger.info(f"Backfilling art for {total} albums with {workers} workers")
+
+    def finished(future):
+        nonlocal done
+        album = pending.pop(future)
+        try:
+            status = future.result()
+        except Exception as e:
+            logger.error(f"{album['artists']} - {album['album']}: {e}")
+            status = "failed"
+        counts[status] += 1
+        done += 1
+        if status != "present" or done % 100 == 0 or done == total:
+            logger.info(f"[{done}/{total}] {status}: {album['artists']} - {album['album']} "
+                        f"({finder.downloader.throttle_status()}, {time.time() - start:.0f}s)")
+
+    # every worker shares the finder's rate limiter, so more workers never means more requests per minute
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for album in storage.iter_albums():
+            # keep only a few albums queued so the history is streamed rather than loaded
+            while len(pending) >= workers * 2:
+                (completed, _not_done) = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finished(future)
+            pending[executor.submit(backfill_album, finder, album)] = album
+        while pending:
+            (completed, _not_done) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                finished(future)
+
+    storage.close_connection()
+    logger.info(f"Backfill complete in {time.time() - start:.0f}s: {counts}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download missing album art for the albums in the music_data history")
+    parser.add_argument("--db", default="music_data.db", help="music data database (default: music_data.db)")
+    parser.add_argument("--workers", type=int, default=2, help="albums looked up concurrently (default: 2)")
+    args = parser.parse_args()
+    backfill(args.db, max(args.workers, 1))
+
+
+if __name__ == "__main__":
+    main()
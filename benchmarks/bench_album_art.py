@@ -0,0 +1,47 @@
+'''Album art preparation for the display at 480p, 720p and 1080p screen heights: the old
+full decode + resize + RGBA overlay path against draft mode decoding and a lookup table
+dim. The source is a generated 1000x1000 JPEG, the size the art is downloaded at.'''
+import io
+
+from PIL import Image
+
+from benchutil import measure, report
+
+from npart import dim_art, load_display_art
+
+SCREEN_HEIGHTS = (480, 720, 1080)
+
+
+def make_source_art(size: int = 1000) -> bytes:
+    '''A photo-like test image, gradients and detail compress like real album art'''
+    gradient = Image.linear_gradient("L").resize((size, size))
+    detail = Image.effect_noise((size, size), 64)
+    image = Image.merge("RGB", (gradient, detail, gradient.transpose(Image.ROTATE_90)))
+    data = io.BytesIO()
+    image.save(data, "JPEG", quality=90)
+    return data.getvalue()
+
+
+def original_art(image_data: bytes, size: int):
+    '''The previous mk_album_art, without the PhotoImage conversion'''
+    original_image = Image.open(io.BytesIO(image_data))
+    original_image = original_image.resize((size, size))
+    dimmed_image = original_image.copy()
+    overlay = Image.new('RGBA', dimmed_image.size, (0, 0, 0, 128))
+    dimmed_image.paste(overlay, (0, 0), overlay)
+    return original_image, dimmed_image
+
+
+def run() -> dict:
+    image_data = make_source_art()
+    results = {}
+    for height in SCREEN_HEIGHTS:
+        results[f"{height}p_original"] = measure(lambda: original_art(image_data, height), number=10)
+        results[f"{height}p_draft"] = measure(lambda: load_display_art(io.BytesIO(image_data), height), number=10)
+        image = load_display_art(io.BytesIO(image_data), height)
+        results[f"{height}p_dim"] = measure(lambda: dim_art(image), number=10)
+    return results
+
+
+if __name__ == "__main__":
+    report("Album art preparation (1000px JPEG source)", run())
@@ -0,0 +1,83 @@
+'''Album track listing: cache hits versus the iTunes lookup API versus scraping an
+album page, and the targeted script tag scan versus a full BeautifulSoup parse.
+Bytes are what each source transfers (uncompressed) for a 14 track album.
+
+The album page is SYNTHETIC unless a recorded page is saved as fixtures/apple_music_album.html
+(album_page_source in the results says which was used). The synthetic page is padded to
+300 KB, an assumed size for an album page's HTML, not a measured one. The scan stops at the
+script tag in the head, so its time barely depends on the padding, while the full parse and
+the page bytes grow with it: read those as the cost for a page of that size.'''
+import json
+import os
+import tempfile
+
+from benchutil import fixture, measure, report
+
+from npalbumdata import AlbumDataCache, parse_lookup_response, parse_serialized_server_data, scan_serialized_server_data
+
+
+def album_page(track_count: int = 14, padding: int = 300_000) -> str:
+    '''A synthetic album page shaped like the Apple Music one, the script tag sits in the head
+    and the rest of the page is padding standing in for the markup the scraper doesn't need'''
+    sections = [
+        {"itemKind": "trackLockup", "items": [{"title": f"Track {n}", "duration": 200000} for n in range(1, track_count + 1)]},
+        {"itemKind": "containerDetailTracklistFooterLockup",
+         "items": [{"description": f"May 1, 2020\n{track_count} Songs, 52 minutes"}]},
+    ]
+    payload = json.dumps([{"data": {"sections": sections}}])
+    filler = '<div class="song"><span>filler</span></div>\n' * (padding // 44)
+    return (f'<html><head><title>Album</title>'
+            f'<script type="application/json" id="serialized-server-data">{payload}</script>'
+            f'</head><body>{filler}</body></html>')
+
+
+def chunks(page: str, size: int = 16384):
+    for start in range(0, len(page), size):
+        yield page[start:start + size]
+
+
+def load_album_page() -> tuple:
+    '''(page, source), a recorded Apple Music page when one is in the fixtures, else the synthetic one'''
+    try:
+        with open(fixture("apple_music_album.html"), encoding="utf8") as file:
+            return file.read(), "recorded"
+    except FileNotFoundError:
+        return album_page(), "synthetic, 300 KB padding"
+
+
+def run() -> dict:
+    (page, source) = load_album_page()
+    with open(fixture("itunes_lookup_album.json"), encoding="utf8") as file:
+        # the API sends compact JSON, the fixture is indented for readability
+        lookup = json.dumps(json.load(file), separators=(",", ":"))
+    results = {
+        "album_page_source": source,
+        "album_page_bytes": len(page.encode("utf8")),
+        "lookup_api_bytes": len(lookup.encode("utf8")),
+    }
+    results["lookup_api_parse"] = measure(lambda: parse_lookup_response(lookup), number=200)
+    results["targeted_scan"] = measure(lambda: parse_serialized_server_data(scan_serialized_server_data(chunks(page))[0]), number=20)
+    try:
+        from bs4 import BeautifulSoup
+
+        def full_parse():
+            soup = BeautifulSoup(page, 'html.parser')
+            tag = soup.find('script', {'type': 'application/json', 'id': 'serialized-server-data'})
+            return parse_serialized_server_data(tag.string)
+
+        results["beautifulsoup_parse"] = measure(full_parse, number=2, repeat=3)
+    except ImportError:
+        results["beautifulsoup_parse"] = "bs4 not installed"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AlbumDataCache(os.path.join(tmp, "bench.db"))
+        album_data = parse_serialized_server_data(scan_serialized_server_data(chunks(page))[0])
+        for album_id in range(1000):
+            cache.put(album_id, album_data)
+        results["cache_hit"] = measure(lambda: cache.get(500), number=200)
+        cache.close_connection()
+    return results
+
+
+if __name__ == "__main__":
+    report("Album track listing", run())
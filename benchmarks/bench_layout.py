@@ -0,0 +1,50 @@
+'''Auto-fit text layout for a new track: the title, album and artist fitted into 720p label
+boxes, with a cold font metrics cache (first track), with the glyphs cached (a new track) and
+with the strings cached too (the same track again). Text is measured with
+Pillow's built in font since Tk needs a display, the glyph cache works the same way.'''
+from benchutil import measure, report
+
+from nplayout import FontMetrics, PillowFont, TextFitter
+
+SCREEN = (1280, 720)
+TRACKS = [
+    ("Symphony No. 9 in D Minor, Op. 125 \"Choral\": IV. Presto - Allegro assai (Live at Carnegie Hall, 1963)",
+     "Beethoven: Symphony No. 9 (Remastered 2011)", "Leonard Bernstein\nNew York Philharmonic"),
+    ("Song (feat. Someone Else) [Extended Mix]", "The Very Long Compilation Of Club Classics Volume 12",
+     "Artist One\nArtist Two\nArtist Three"),
+    ("Short", "Album", "Artist"),
+]
+
+
+def fit_track(metrics: FontMetrics):
+    (width, height) = SCREEN
+    fontsize = height // 33
+    title = TextFitter(metrics, "DejaVuSans-Bold.ttf", "bold", fontsize, int(fontsize * 0.6))
+    text = TextFitter(metrics, "DejaVuSans.ttf", "normal", fontsize, int(fontsize * 0.6))
+    box_width = int((width - height) * 0.97)
+    line_height = metrics.line_height(title.family, fontsize, title.weight)
+    for (track_title, album, artist) in TRACKS:
+        title.fit(track_title, box_width, 3 * line_height)
+        text.fit(album, box_width - 20, 2 * line_height)
+        text.fit(artist, box_width - 20, 4 * line_height)
+
+
+def run() -> dict:
+    warm_metrics = FontMetrics(PillowFont)
+    fit_track(warm_metrics)
+
+    def new_strings():
+        # glyphs already measured, but the strings are new like they are for a new track
+        warm_metrics.strings.clear()
+        fit_track(warm_metrics)
+
+    return {
+        "cold_3_tracks": measure(lambda: fit_track(FontMetrics(PillowFont)), number=5),
+        "glyphs_cached_3_tracks": measure(new_strings, number=100),
+        "repeat_3_tracks": measure(lambda: fit_track(warm_metrics), number=100),
+        "glyphs_measured": warm_metrics.measure_calls,
+    }
+
+
+if __name__ == "__main__":
+    report("Auto-fit text layout (3 tracks, 720p boxes)", run())
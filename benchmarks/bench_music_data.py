@@ -0,0 +1,42 @@
+'''Play history queries on a 100k row music_data.db: retrieve_tracks() and
+retrieve_albums(), which back the /tracks and /albums pages, and iterating the
+distinct albums with iter_albums() as the art backfill does.'''
+import os
+import tempfile
+
+from benchutil import measure, report
+
+from npmusicdata import MusicDataStorage
+
+ROWS = 100_000
+ALBUMS = 2_000
+
+
+def fill(storage: MusicDataStorage, rows: int):
+    storage.cursor.executemany(
+        '''INSERT INTO music_data (album, album_id, artists, title, elapsed, track, tracks, npclient)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        ((f"Album {n % ALBUMS}", str(1000000 + n % ALBUMS), f"Artist {n % ALBUMS // 4}",
+          f"Track {n % 12 + 1}", 200, f"{n % 12 + 1}", 12, "bench") for n in range(rows))
+    )
+    storage.conn.commit()
+
+
+def run() -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = MusicDataStorage(os.path.join(tmp, "music_data.db"))
+        try:
+            fill(storage, ROWS)
+            results = {
+                "rows": ROWS,
+                "retrieve_tracks": measure(storage.retrieve_tracks, number=1, repeat=3),
+                "retrieve_albums": measure(storage.retrieve_albums, number=1, repeat=3),
+                "iter_albums": measure(lambda: sum(1 for _ in storage.iter_albums()), number=1, repeat=3),
+            }
+        finally:
+            storage.close_connection()
+    return results
+
+
+if __name__ == "__main__":
+    report(f"Play history ({ROWS} rows)", run())
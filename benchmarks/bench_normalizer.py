@@ -0,0 +1,69 @@
+'''Normalizer timings, with and without the memo, checked against the golden
+outputs in fixtures/normalizer_golden.json. Run with --check to only verify
+the outputs (exits non-zero on a mismatch).'''
+import json
+import sys
+
+from benchutil import fixture, measure, report
+
+from get_cover_art.deromanizer import DeRomanizer
+from get_cover_art.normalizer import AlbumNormalizer, ArtistNormalizer
+
+
+def load_corpus() -> list:
+    with open(fixture("normalizer_golden.json"), encoding="utf8") as file:
+        return json.load(file)
+
+
+def check(corpus: list) -> list:
+    '''Returns the corpus entries whose output differs from the golden output'''
+    artist_normalizer = ArtistNormalizer()
+    album_normalizer = AlbumNormalizer()
+    deromanizer = DeRomanizer()
+    mismatches = []
+    for entry in corpus:
+        album = album_normalizer.normalize(entry["input"])
+        output = {
+            "artist": artist_normalizer.normalize(entry["input"]),
+            "album": album,
+            "deromanized": deromanizer.convert_all(album),
+        }
+        for (key, value) in output.items():
+            if value != entry[key]:
+                mismatches.append({"input": entry["input"], "field": key, "expected": entry[key], "actual": value})
+    return mismatches
+
+
+def run() -> dict:
+    corpus = load_corpus()
+    inputs = [entry["input"] for entry in corpus]
+    mismatches = check(corpus)
+    results = {"golden_mismatches": len(mismatches)}
+    for normalizer in (ArtistNormalizer(), AlbumNormalizer()):
+        name = type(normalizer).__name__
+
+        def cold():
+            # clear the memo so every string is normalized from scratch
+            normalizer._cached_normalize.cache_clear()
+            for value in inputs:
+                normalizer.normalize(value)
+
+        def warm():
+            for value in inputs:
+                normalizer.normalize(value)
+
+        results[f"{name}_uncached"] = measure(cold, number=50)
+        results[f"{name}_memoized"] = measure(warm, number=50)
+    deromanizer = DeRomanizer()
+    results["DeRomanizer_memoized"] = measure(lambda: [deromanizer.convert_all(value) for value in inputs], number=50)
+    return results
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        mismatches = check(load_corpus())
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(mismatches)} mismatches")
+        sys.exit(1 if mismatches else 0)
+    report(f"Normalizers ({len(load_corpus())} golden strings per call)", run())
@@ -0,0 +1,61 @@
+'''Parse time and retained memory of iTunes search responses, comparing the
+eval() based parsing that AppleDownloader._query() used to do with the
+projected JSON decoder.'''
+import json
+import tracemalloc
+
+from benchutil import fixture, measure, report
+
+from get_cover_art.itunes_result import parse_search_response
+
+FIXTURES = ("itunes_search_5.json", "itunes_search_50.json")
+
+
+def legacy_parse(text: str) -> dict:
+    safe_json = text.replace('true', 'True').replace('false', 'False')
+    return eval(safe_json)
+
+
+def eval_safe(text: str) -> str:
+    # eval() can't handle null, drop those fields so the old path can be timed at all
+    data = json.loads(text)
+    for result in data["results"]:
+        for key in [key for (key, value) in result.items() if value is None]:
+            del result[key]
+    return json.dumps(data)
+
+
+def retained_bytes(parse, text: str) -> int:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    parsed = parse(text)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del parsed
+    return size
+
+
+def run() -> dict:
+    results = {}
+    for name in FIXTURES:
+        with open(fixture(name)) as file:
+            text = file.read()
+        try:
+            legacy_parse(text)
+            legacy_error = ""
+        except Exception as error:
+            legacy_error = f"{type(error).__name__}: {error}"
+        legacy_text = eval_safe(text)
+        results[name] = {
+            "legacy_eval": measure(lambda: legacy_parse(legacy_text), number=50),
+            "legacy_eval_error": legacy_error,
+            "legacy_eval_retained_bytes": retained_bytes(legacy_parse, legacy_text),
+            "projected_json": measure(lambda: parse_search_response(text), number=50),
+            "projected_json_retained_bytes": retained_bytes(parse_search_response, text),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    report("iTunes search response parsing", run())
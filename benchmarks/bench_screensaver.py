@@ -0,0 +1,86 @@
+'''Screensaver with 100, 1k and 10k albums of art: starting it (listing the art and filling
+a 16x9 grid) against decoding the whole library up front as it used to, picking a random
+image that isn't on the screen yet, and one full _update_grid() pass (5% of the cells change).
+Runs on the SDL dummy video driver with small generated art, so the numbers show how the
+work grows with the library rather than real decode times.'''
+import os
+import random
+import tempfile
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from PIL import Image
+
+from benchutil import measure, report
+
+import screensaver
+from screensaver import AlbumArtScreensaver
+
+IMAGE_COUNTS = (100, 1000, 10000)
+GRID_SIZE = (16, 9)
+TILE_SIZE = 8
+
+
+def make_library(path: str, count: int):
+    '''count albums of art named by album id, like album_images/'''
+    for n in range(len(os.listdir(path)), count):
+        Image.new("RGB", (32, 32), (n % 256, n // 256 % 256, 128)).save(os.path.join(path, f"{1000000 + n}.jpg"))
+
+
+def fill_grid(saver: AlbumArtScreensaver, folder: str) -> list:
+    '''Start the screensaver grid the way _screensaver() does'''
+    saver.images = saver._load_images(folder, TILE_SIZE, GRID_SIZE[0] * GRID_SIZE[1])
+    saver.used_images = set()
+    saver.image_map = {}
+    saver.upcoming.clear()
+    grid = [[None] * GRID_SIZE[0] for _ in range(GRID_SIZE[1])]
+    for i in range(len(grid)):
+        for j in range(len(grid[i])):
+            image = saver._select_random_image(saver.images.names)
+            saver.used_images.add(image)
+            grid[i][j] = saver.images.get(image)
+            saver.image_map[f"{i}/{j}"] = image
+    return grid
+
+
+def load_all(saver: AlbumArtScreensaver, folder: str) -> list:
+    '''The previous start up, every image in the library decoded before the grid is made'''
+    images = saver._load_images(folder, TILE_SIZE, 0)
+    return [images._load(name) for name in images.names]
+
+
+def run() -> dict:
+    screensaver._import_pygame()
+    pygame = screensaver.pygame
+    pygame.display.init()
+    window = pygame.display.set_mode((GRID_SIZE[0] * TILE_SIZE, GRID_SIZE[1] * TILE_SIZE))
+    random.seed(1)
+    saver = AlbumArtScreensaver()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for count in IMAGE_COUNTS:
+                make_library(folder, count)
+                number = max(10, 10000 // count)
+                # the first start makes the tiles, the timed ones load them from album_images/derived/
+                grid = fill_grid(saver, folder)
+                results[f"start_{count}"] = measure(lambda: fill_grid(saver, folder), number=1, repeat=3)
+                results[f"start_load_all_{count}"] = measure(lambda: load_all(saver, folder), number=1, repeat=1)
+                grid = fill_grid(saver, folder)
+                images = saver.images.names
+                results[f"select_random_image_{count}"] = measure(lambda: saver._select_random_image(images), number=number)
+
+                def update():
+                    saver.image_map = saver._update_grid(window, saver.image_map.copy(), grid, images, TILE_SIZE)
+                    saver._prefetch(images)
+
+                results[f"update_grid_{count}"] = measure(update, number=number)
+                results[f"surfaces_kept_{count}"] = len(saver.images.surfaces)
+    finally:
+        pygame.display.quit()
+    return results
+
+
+if __name__ == "__main__":
+    report("Screensaver (16x9 grid)", run())
@@ -0,0 +1,63 @@
+'''NowPlayingState throughput: update_state() for a stream of client payloads, alternating
+between a changed payload and a repeat of the last one, and current_track() fuzzy matching
+a title against track lists of 12 and 40 tracks.'''
+import os
+import tempfile
+
+from benchutil import measure, report
+
+from npstate import NowPlayingState
+
+PAYLOADS = 1000
+
+
+def payloads(count: int) -> list:
+    '''A client reporting every second, a new payload and then the same one again'''
+    result = []
+    for n in range(count // 2):
+        payload = {
+            "album": "Album", "artist": ["Artist"], "title": f"Track {n // 180}",
+            "duration": "3:00", "elapsed": f"{(n % 180) // 60}:{n % 60:02d}",
+            "state": "playing", "npclient": "bench",
+        }
+        result.extend([payload, dict(payload)])
+    return result
+
+
+def update_all(state: NowPlayingState, stream: list):
+    state.api_payloads = list(stream)
+    while state.api_payloads:
+        state.update_state()
+
+
+def track_list(count: int) -> list:
+    titles = ["Intro", "Mountains (Live)", "Something in the Way", "Come As You Are",
+              "On a Plain", "Lithium", "Breed", "Polly", "Territorial Pissings",
+              "Drain You", "Lounge Act", "Stay Away"]
+    return [f"{titles[n % len(titles)]}{' II' * (n // len(titles))}" for n in range(count)]
+
+
+def run() -> dict:
+    # a finished track is saved to music_data.db in the working directory, keep it out of the repo
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            state = NowPlayingState()
+            stream = payloads(PAYLOADS)
+            update = measure(lambda: update_all(state, stream), number=5)
+            results = {
+                f"update_state_{PAYLOADS}_payloads": update,
+                "update_state_per_second": round(PAYLOADS / (update["best_ms"] / 1000)),
+            }
+            for count in (12, 40):
+                state.set_tracks(track_list(count))
+                state.set_title("Lithium (Remastered)")
+                results[f"current_track_{count}_tracks"] = measure(state.current_track, number=200)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+if __name__ == "__main__":
+    report("Now playing state", run())
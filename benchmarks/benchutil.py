@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+
+# benchmarks import the project modules from the repository root
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_PATH = os.path.join(ROOT_PATH, 'benchmarks', 'fixtures')
+if ROOT_PATH not in sys.path:
+    sys.path.insert(0, ROOT_PATH)
+
+
+def fixture(name: str) -> str:
+    return os.path.join(FIXTURE_PATH, name)
+
+
+def measure(func, number: int = 100, repeat: int = 5) -> dict:
+    '''Time func, returns the best and mean time per call in milliseconds'''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number * 1000)
+    return {
+        "best_ms": round(min(timings), 4),
+        "mean_ms": round(sum(timings) / len(timings), 4),
+        "calls": number * repeat,
+    }
+
+
+def report(name: str, results: dict):
+    print(name)
+    for (case, result) in results.items():
+        print(f"  {case}: {result}")
@@ -0,0 +1,101 @@
+'''Runs the benchmarks and saves the results as JSON, so runs can be compared.
+
+    python3 benchmarks/run.py                            # every bench_*.py, saved to benchmarks/results/
+    python3 benchmarks/run.py state screensaver          # only bench_state.py and bench_screensaver.py
+    python3 benchmarks/run.py --compare results/old.json # show the change against an earlier run
+
+A benchmark that can't run (e.g. a missing dependency) is recorded with its error and
+the others still run.'''
+import argparse
+import glob
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchutil import ROOT_PATH, report
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = os.path.join(BENCH_PATH, "results")
+
+
+def available() -> list:
+    return sorted(os.path.basename(path)[len("bench_"):-len(".py")]
+                  for path in glob.glob(os.path.join(BENCH_PATH, "bench_*.py")))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_PATH,
+                                       universal_newlines=True, stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return ""
+
+
+def run_benchmark(name: str) -> dict:
+    start = time.perf_counter()
+    try:
+        results = importlib.import_module(f"bench_{name}").run()
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {"seconds": round(time.perf_counter() - start, 2), "results": results}
+
+
+def compare(current: dict, previous: dict):
+    '''Print the best times that are in both runs, with the change from the previous run'''
+    for (name, benchmark) in current["benchmarks"].items():
+        old_results = previous.get("benchmarks", {}).get(name, {}).get("results", {})
+        for (case, result) in benchmark.get("results", {}).items():
+            old = old_results.get(case)
+            if not isinstance(result, dict) or not isinstance(old, dict) or "best_ms" not in result or not old.get("best_ms"):
+                continue
+            change = (result["best_ms"] - old["best_ms"]) / old["best_ms"] * 100
+            print(f"  {name}.{case}: {old['best_ms']} -> {result['best_ms']} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the NowPlayingDisplay benchmarks")
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run, from: {', '.join(available())}")
+    parser.add_argument("--output", help="JSON file for the results, default benchmarks/results/<time>.json")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    names = args.benchmarks or available()
+    unknown = [name for name in names if name not in available()]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    run = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "benchmarks": {},
+    }
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        run["benchmarks"][name] = result = run_benchmark(name)
+        if "error" in result:
+            print(f"  failed: {result['error']}")
+        else:
+            report(f"{name} ({result['seconds']}s)", result["results"])
+
+    output = args.output or os.path.join(RESULTS_PATH, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf8") as file:
+        json.dump(run, file, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf8") as file:
+            previous = json.load(file)
+        print(f"Compared with {args.compare} ({previous.get('commit') or 'unknown commit'})")
+        compare(run, previous)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,17 @@
 import logging
-import time
 import re
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from typing import Callable, Iterator, List, Optional, Tuple
 from urllib.parse import quote, urlparse
-from urllib.request import HTTPError, Request, urlopen
 
+from get_cover_art.art_store import ArtStore
 from get_cover_art.deromanizer import DeRomanizer
+from get_cover_art.http_client import HttpClient
+from get_cover_art.itunes_result import parse_search_response
+from get_cover_art.rate_limiter import RateLimiter, Throttled
+from get_cover_art.scoring import CandidateScorer
+from get_cover_art.lookup_cache import LookupCache
 from get_cover_art.meta import Meta
 from get_cover_art.normalizer import AlbumNormalizer, ArtistNormalizer
 
@@ -14,15 +20,19 @@ from get_cover_art.normalizer import AlbumNormalizer, ArtistNormalizer
 # https://itunes.apple.com/search?term=The%20Open&entity=musicTrack&attribute=artistTerm&term=The%20Open&attribute=albumTerm&term=ive%20never%20been%20to%20china&attribute=songTerm&The%20Open
 
 QUERY_TEMPLATE = "https://itunes.apple.com/search?term=%s&media=music&entity=%s"
+LOOKUP_TEMPLATE = "https://itunes.apple.com/lookup?id=%s&entity=song&limit=200"
 ATTRIBUTE_QUERY_TEMPLATE = "https://itunes.apple.com/search?term=%s&entity=musicTrack&attribute=artistTerm&term=%s&attribute=albumTerm&term=%s&attribute=songTerm=%s"
-USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.55 Safari/537.36"
 THROTTLED_HTTP_CODES = [403, 429]
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class AppleDownloader(object):
-    def __init__(self, debug: bool, throttle: float, art_size: int, art_quality: int):
+    def __init__(self, debug: bool, throttle: float, art_size: int, art_quality: int,
+                 cache: Optional[LookupCache] = None, store: Optional[ArtStore] = None, search_workers: int = 0,
+                 http: Optional[HttpClient] = None, limiter: Optional[RateLimiter] = None,
+                 max_wait: Optional[float] = None, max_attempts: int = 4, min_confidence: float = 0.8,
+                 on_download: Optional[Callable[[str, bytes], None]] = None):
         quality_suffix = "bb" if art_quality == 0 else f"-{art_quality}"
         self.file_suffix = f"{art_size}x{art_size}{quality_suffix}"
         self.debug = debug
@@ -32,36 +42,62 @@ class AppleDownloader(object):
         else:
             print("debug logging disabled for AppleDownloader")
         self.throttle = throttle
+        # iTunes allows roughly 20 requests a minute, the throttle is the first backoff step
+        self.limiter = limiter or RateLimiter(rate=20 / 60, burst=6, backoff=throttle, max_backoff=60)
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
         self.artist_normalizer = ArtistNormalizer()
         self.album_normalizer = AlbumNormalizer()
         self.deromanizer = DeRomanizer()
-        
-    def _urlopen_safe(self, url: str) -> str:
-        while True:
-            try:
-                q = Request(url)
-                q.add_header("User-Agent", USER_AGENT)
-                response = urlopen(q)
-                return response.read()
-            except HTTPError as e:
-                if e.code in THROTTLED_HTTP_CODES:
-                    # we've been throttled, time to sleep
-                    domain = urlparse(url).netloc
-                    logger.warning(f"Request limit exceeded from {domain}, trying again in {self.throttle} seconds...")
-                    time.sleep(self.throttle)
-                else:
-                    raise e
-
-    def _urlopen_text(self, url: str) -> str:
+        self.scorer = CandidateScorer(self.artist_normalizer, self.album_normalizer)
+        # matches below this confidence try the next search variant before settling
+        self.min_confidence = min_confidence
+        self.http = http or HttpClient()
+        self.cache = cache
+        self.store = store
+        # called with (collectionId, image data) after new art has been saved
+        self.on_download = on_download
+        # with search_workers > 0 the search cascade runs concurrently on a bounded pool,
+        # the pool size is what keeps the burst of requests within the iTunes rate limit
+        self.concurrent = search_workers > 0
+        self.executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="search") if self.concurrent else None
+
+    def _urlopen_safe(self, url: str) -> bytes:
+        '''GET a url through the shared rate limiter. Raises Throttled rather than
+        blocking the caller for longer than max_wait when the host is throttling us.'''
+        domain = urlparse(url).netloc
+        delay = 0.0
+        for _attempt in range(self.max_attempts):
+            self.limiter.acquire(domain, self.max_wait)
+            response = self.http.get(url)
+            if response.status_code in THROTTLED_HTTP_CODES:
+                # we've been throttled, back off before trying again
+                delay = self.limiter.throttled(domain, response.headers.get("Retry-After"))
+                logger.warning(f"Request limit exceeded from {domain}, trying again in {delay:.1f} seconds...")
+                continue
+            self.limiter.succeeded(domain)
+            response.raise_for_status()
+            return response.content
+        raise Throttled(domain, delay)
+
+    def throttle_status(self, url: str = QUERY_TEMPLATE) -> str:
+        '''Rate limit status (ok, queued or throttled) of the host for url, iTunes search by default'''
+        return self.limiter.status(urlparse(url).netloc)
+
+    def _urlopen_text(self, url: str) -> Optional[str]:
+        '''The response text, or None if the request was throttled or failed'''
         try:
             return self._urlopen_safe(url).decode("utf8")
+        except Throttled as error:
+            logger.warning(f"Skipping query, {error}")
+            return None
         except Exception as error:
             if ("certificate verify failed" in str(error)):
                 logger.error(f"Python doesn't have SSL certificates installed, can't access {url}")
                 logger.error("Please run 'Install Certificates.command' from your Python installation directory.")
             else:
                 logger.error(f"Error reading URL ({url}): {str(error)})")
-            return ""
+            return None
 
     def _download_from_url(self, image_url: str, dest_path: str):
         image_data = self._urlopen_safe(image_url)
@@ -71,7 +107,8 @@ class AppleDownloader(object):
             file.write(image_data)
         logger.debug(f"Downloaded cover art: {dest_path}")
 
-    def _query(self, artist: str, album: str, title: str, attr_search: bool = False) -> dict:
+    def _query(self, artist: str, album: str, title: str, attr_search: bool = False) -> Optional[dict]:
+        '''The parsed search response, None if there was no usable response'''
         query_term = f"{artist} {title} {album}"
         logger.debug(f"Query term: {query_term}")
         if attr_search:
@@ -80,125 +117,201 @@ class AppleDownloader(object):
             url = QUERY_TEMPLATE % (quote(query_term), "musicTrack")
         logger.debug(f"URL: {url}")
         json = self._urlopen_text(url)
-        if json:
-            try:
-                safe_json = json.replace('true', 'True').replace('false', 'False')
-                return eval(safe_json)
-            except Exception as error:
-                logger.error(f"Error parsing JSON from {url}: {str(error)}")
-                pass
-        return {}
-
-    def _match_strings(self, value1: str, value2: str) -> bool:
-        '''Sometimes artists are not in the same order or one might be missing. 
-        Check if two artist strings are similar enough to be considered the same artist.'''
-        # Split the artist strings into sets of lower case individual elements
-        set1 = set(value1.lower().split())
-        set2 = set(value2.lower().split())
-        # Calculate the number of common elements
-        common_elements = len(set1.intersection(set2))
-        # Calculate the percentage overlap
+        if json is None:
+            return None
         try:
-            percentage_overlap = (common_elements / min(len(set1), len(set2))) * 100
-        except ZeroDivisionError:
-            return False
-        # Check if the percentage overlap is greater than 75%
-        # tune this value to be higher if matches are not accurate enough
-        return percentage_overlap > 75
+            return parse_search_response(json)
+        except Exception as error:
+            logger.error(f"Error parsing JSON from {url}: {str(error)}")
+        return None
 
     def _strip_paren_words(self, value: str) -> str:
         '''Remove words in parentesis from the string'''
         return re.sub(r'\([^)]*\)', '', value)
 
-    def _get_data(self, meta: Meta) -> Tuple[str, str, dict, bool]:
+    def _search_variants(self, meta: Meta) -> List[Tuple[str, str, str]]:
+        '''The search cascade as a list of (artist, album, title) queries in priority order'''
         norm_artist = self.artist_normalizer.normalize(meta.artist)
         norm_album = self.album_normalizer.normalize(meta.album)
         norm_title = self.album_normalizer.normalize(meta.title)
 
-        # # 0th search, using attributes
-        # info = self._query(norm_artist, norm_album, norm_title, True)
-        # logger.debug(f"Attribute search query: {norm_artist}, {norm_album}, {norm_title}")
-        # if info.get('resultCount') > 0:
-        #     logger.debug(f"0st search info: {info}")
-        #     return (norm_artist, norm_album, info, len(norm_album) == 0)
-
         # 1st search, with all artists
-        info = self._query(norm_artist, norm_album, norm_title)
-        logger.debug(f"Search query: {norm_artist}, {norm_album}, {norm_title}")
-        if info.get('resultCount') > 0:
-            logger.debug(f"1st search info: {info}")
-            return (norm_artist, norm_album, info, len(norm_album) == 0)
+        variants = [(norm_artist, norm_album, norm_title)]
 
         # 2nd search, if any (parenthesis words) in the TITLE, try again without those words
         if "(" in meta.title:
             s_norm_title = self.artist_normalizer.normalize(self._strip_paren_words(meta.title))
-            info = self._query(norm_artist, norm_album, s_norm_title)
-            logger.debug(f"Search query: {norm_artist}, {norm_album}, {s_norm_title}")
-        if info.get('resultCount') > 0:
-                logger.debug(f"2nd search info: {info}")
-                return (norm_artist, norm_album, info, len(norm_album) == 0)
+            variants.append((norm_artist, norm_album, s_norm_title))
 
         # 3rd search, try a search with each individual artist
-        album_artists = meta.artist.split(",")
-        for a_artist in album_artists:
-            norm_a_artist = self.artist_normalizer.normalize(a_artist)
-            info = self._query(norm_a_artist, norm_album, norm_title)
-            if info.get('resultCount') > 0:
-                logger.debug(f"3rd search info: {info}")
-                return (norm_a_artist, norm_album, info, len(norm_album) == 0)
-            
+        for a_artist in meta.artist.split(","):
+            variants.append((self.artist_normalizer.normalize(a_artist), norm_album, norm_title))
+
         # 4nd search, if any (parenthesis words) in the ALBUM, try again without those words
         if "(" in meta.album:
             s_norm_album = self.artist_normalizer.normalize(self._strip_paren_words(meta.album))
-            info = self._query(norm_artist, s_norm_album, norm_title)
-            logger.debug(f"Search query: {norm_artist}, {s_norm_album}, {norm_title}")
-            if info.get('resultCount') > 0:
-                logger.debug(f"4th search info: {info}")
-                return (norm_artist, s_norm_album, info, len(s_norm_album) == 0)
+            variants.append((norm_artist, s_norm_album, norm_title))
 
         # 5th search, if no results found yet, try deromanizer
-        logger.debug("No results found yet, trying deromanizer")
-        artist = self.deromanizer.convert_all(norm_artist)
-        album = self.deromanizer.convert_all(norm_album)
-        info = self._query(artist, album, norm_title)
-        return (artist, album, info, len(album) == 0)
-
-    def download(self, meta: Meta, art_path: str) -> bool:
-        (meta_artist, meta_album, info, title_only) = self._get_data(meta)
-        logger.debug(f"Meta artist: {meta_artist}, Meta album: {meta_album}, Info: {info}, Title only: {title_only}")
-        if info:
-            try:
-                art = ""
-                # go through albums, use exact match or first contains match if no exacts found
-                results = reversed(info.get('results'))
-                if title_only:
-                    # if no album name provided, use earliest matching release
-                    results = reversed(sorted(results, key=lambda x: x.get('releaseDate')))
-                for album_info in results:
-                    artist = self.artist_normalizer.normalize(album_info.get('artistName'))
-                    album = self.album_normalizer.normalize(album_info.get('collectionName'))
-                    if not self._match_strings(artist, self.artist_normalizer.normalize(meta_artist)):
-                        logger.debug(f"Skipping album {album} by {artist} - {meta_artist} - artist mismatch")
-                        continue
-                    if not self._match_strings(album, self.album_normalizer.normalize(meta_album)):
-                        logger.debug(f"Skipping album by {artist} - {album} - album mismatch")
-                        continue
-                    art = album_info.get('artworkUrl100').replace('100x100bb', self.file_suffix)
-                    if not title_only and meta_album == album:
-                        logger.debug(f"Exact album match found: {meta_album} - {album}: {album_info}")
-                        break # exact match found
+        variants.append((self.deromanizer.convert_all(norm_artist), self.deromanizer.convert_all(norm_album), norm_title))
+
+        # drop repeated queries (e.g. a single artist is the same as all artists), keeping the first
+        return list(dict.fromkeys(variants))
+
+    def lookup_tracks(self, collection_id) -> Optional[str]:
+        '''Get the tracks of an album from the iTunes lookup API, returns the JSON response text (None on errors)'''
+        url = LOOKUP_TEMPLATE % quote(str(collection_id))
+        logger.debug(f"Lookup URL: {url}")
+        return self._urlopen_text(url)
+
+    def _has_results(self, info: dict) -> bool:
+        return info.get('resultCount', 0) > 0
+
+    def _search(self, variants: List[Tuple[str, str, str]]) -> Iterator[Tuple[int, Tuple[str, str, str], dict]]:
+        '''Run the search cascade, yielding (index, variant, info) in priority order.
+        Stop iterating (or close the generator) once a good enough match is found.'''
+        if self.concurrent and len(variants) > 1:
+            yield from self._search_concurrent(variants)
+            return
+        for (index, variant) in enumerate(variants, start=1):
+            yield (index, variant, self._query(*variant))
+
+    def _search_concurrent(self, variants: List[Tuple[str, str, str]]) -> Iterator[Tuple[int, Tuple[str, str, str], dict]]:
+        '''Run the search cascade on the worker pool. Results are still yielded in priority order,
+        so a lower priority search is only looked at once every higher priority search fell short.'''
+        cancelled = Event()
+
+        def search(variant):
+            # searches still queued when a winner is found don't need to run
+            if cancelled.is_set():
+                return {}
+            return self._query(*variant)
+
+        futures = [self.executor.submit(search, variant) for variant in variants]
+        try:
+            for (index, (variant, future)) in enumerate(zip(variants, futures), start=1):
+                yield (index, variant, future.result())
+        finally:
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+
+    def _cache_key(self, meta: Meta) -> Tuple[str, str, str]:
+        return (self.artist_normalizer.normalize(meta.artist),
+                self.album_normalizer.normalize(meta.album),
+                self.album_normalizer.normalize(meta.title))
+
+    def _find_art(self, meta: Meta) -> Tuple[str, dict, bool]:
+        '''Search for the album and pick the best scoring result. A search whose best result has low
+        confidence moves on to the next search variant, keeping the best result seen so far.
+        Returns the art url (empty if no match), the album info, and whether every search got a response.'''
+        best = None
+        complete = True
+        searches = self._search(self._search_variants(meta))
+        try:
+            for (index, (artist, album, title), info) in searches:
+                logger.debug(f"Search {index} query: {artist}, {album}, {title}")
+                if info is None:
+                    # throttled or failed, this search can't rule the album out
+                    complete = False
+                    continue
+                if not self._has_results(info):
+                    continue
+                match = self.scorer.best(info.get('results'), artist, album, title)
+                if match is None:
+                    logger.debug(f"Search {index}: no result matched artist ({artist}) and album ({album})")
+                    continue
+                if best is None or match.confidence > best.confidence:
+                    best = match
+                if best.confidence >= self.min_confidence:
+                    break
+                logger.debug(f"Search {index}: low confidence ({match.confidence:.2f}), trying the next search")
+        except Exception as error:
+            logger.error(f"Error encountered when matching artist ({meta.artist}) and album ({meta.album})")
+            logger.error(error)
+            return ("", {}, False)
+        finally:
+            searches.close()
+
+        if best is None:
+            logger.debug(f"Failed to find matching artist ({meta.artist}) and album ({meta.album})")
+            return ("", {}, complete)
+        logger.debug(f"Using match with confidence {best.confidence:.2f}: {best.result}")
+        art = best.result.get('artworkUrl100').replace('100x100bb', self.file_suffix)
+        return (art, best.result, complete)
+
+    def find(self, meta: Meta, art_path: str, force: bool = False) -> Optional[Tuple[str, dict, Optional[bytes]]]:
+        '''Find the album for a track without downloading its art. Returns the art url, the album info
+        and the image data if the art is already on disk, or None if no album matched.'''
+        key = self._cache_key(meta)
+        if self.store and not force:
+            # art for a known album is used straight from disk, no search needed
+            stored = self.store.find_album(key[0], key[1])
+            if stored:
+                logger.debug(f"Art store hit for {meta.artist} - {meta.album}")
+                return ("", stored[1], stored[0])
+
+        cached = self.cache.get(*key) if self.cache else None
+        if cached is None:
+            (art, album_info, complete) = self._find_art(meta)
+            if self.cache:
                 if art:
-                    logger.debug(f"Downloading album art for {meta_artist} - {meta_album} - {meta.title}")
-                    image_data = self._urlopen_safe(art)
-                    with open(f'{art_path}{album_info["collectionId"]}.jpg', 'wb') as file:
-                        file.write(image_data)
-                    return image_data, album_info
+                    self.cache.put(*key, art, album_info)
+                elif complete:
+                    # only an answer from every search is a real miss, a throttled one is tried again next time
+                    self.cache.put_miss(*key)
+        elif cached["matched"]:
+            logger.debug(f"Lookup cache hit for {meta.artist} - {meta.album} - {meta.title}")
+            (art, album_info) = (cached["art_url"], cached["album_info"])
+        else:
+            logger.debug(f"Lookup cache has no match for {meta.artist} - {meta.album} - {meta.title}")
+            return None
+        if not art:
+            return None
+
+        if self.store and not force:
+            dest_path = f'{art_path}{album_info["collectionId"]}.jpg'
+            stored = self.store.find(album_info["collectionId"])
+            image_data = stored[0] if stored else self.store.adopt(album_info, dest_path)
+            if image_data:
+                logger.debug(f"Using stored album art for {album_info['collectionId']}")
+                self.store.add_album(key[0], key[1], album_info["collectionId"])
+                return (art, album_info, image_data)
+        return (art, album_info, None)
 
+    def fetch_art(self, meta: Meta, art: str, album_info: dict, art_path: str) -> Optional[bytes]:
+        '''Download the art found by find() and save it to art_path'''
+        try:
+            logger.debug(f"Downloading album art for {meta.artist} - {meta.album} - {meta.title}")
+            image_data = self._urlopen_safe(art)
+            dest_path = f'{art_path}{album_info["collectionId"]}.jpg'
+            if self.store:
+                if self.store.save(image_data, album_info, dest_path):
+                    key = self._cache_key(meta)
+                    self.store.add_album(key[0], key[1], album_info["collectionId"])
+            else:
+                with open(dest_path, 'wb') as file:
+                    file.write(image_data)
+        except Exception as error:
+            logger.error(f"Error encountered when downloading for artist ({meta.artist}) and album ({meta.album})")
+            logger.error(album_info)
+            logger.error(error)
+            return None
+        if self.on_download:
+            # the art is saved already, a failure here only loses the resized copies
+            try:
+                self.on_download(album_info["collectionId"], image_data)
             except Exception as error:
-                logger.error(f"Error encountered when downloading for artist ({meta_artist}) and album ({meta_album})")
-                logger.error(album_info)
-                logger.error(error)
+                logger.error(f"Error preparing downloaded art for {album_info['collectionId']}: {error}")
+        return image_data
 
-        logger.debug(f"Failed to find matching artist ({meta_artist}) and album ({meta_album})")
+    def download(self, meta: Meta, art_path: str, force: bool = False) -> bool:
+        found = self.find(meta, art_path, force)
+        if found is None:
+            return False
+        (art, album_info, image_data) = found
+        if image_data is None:
+            image_data = self.fetch_art(meta, art, album_info, art_path)
+        if image_data:
+            return image_data, album_info
         return False
-
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from threading import Lock
+from typing import Optional, Tuple
+
+from get_cover_art.itunes_result import ALBUM_FIELDS
+
+logger = logging.getLogger(__name__)
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_EOI = b'\xff\xd9'
+
+
+def atomic_write(path: str, data: bytes, fsync: bool = False):
+    '''Write data to path through a temp file in the same directory and a rename, so a reader
+    (or a crash or power loss) never sees a half written file. fsync flushes it to the disk first.'''
+    (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def is_valid_jpeg(image_data: bytes) -> bool:
+    '''Cheap integrity check that catches empty and truncated downloads:
+    a complete JPEG starts with the SOI marker and ends with the EOI marker.'''
+    if not image_data or not image_data.startswith(JPEG_SOI):
+        return False
+    # some encoders pad the end of the file, ignore that when looking for EOI
+    return image_data.rstrip(b'\x00\r\n').endswith(JPEG_EOI)
+
+
+class ArtStore(object):
+    '''Index of the album art that has already been downloaded to disk.
+    Art can be found by collectionId, or by the normalized artist/album of the
+    track that was played so known albums don't need a search at all.'''
+
+    def __init__(self, db_path: str):
+        self.lock = Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.create_tables()
+
+    def create_tables(self):
+        with self.lock:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS art (
+                                    collection_id TEXT PRIMARY KEY,
+                                    path TEXT,
+                                    size INTEGER,
+                                    album_info TEXT,
+                                    created REAL
+                                )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS albums (
+                                    artist TEXT,
+                                    album TEXT,
+                                    collection_id TEXT,
+                                    PRIMARY KEY (artist, album)
+                                )''')
+            self.conn.commit()
+
+    def find(self, collection_id) -> Optional[Tuple[bytes, dict]]:
+        '''Returns the image data and album info for a collectionId, or None if the
+        art isn't on disk or the file failed the integrity check.'''
+        with self.lock:
+            row = self.conn.execute('''SELECT path, size, album_info FROM art WHERE collection_id = ?''',
+                                    (str(collection_id),)).fetchone()
+        if row is None:
+            return None
+        (path, size, album_info) = row
+        try:
+            with open(path, 'rb') as file:
+                image_data = file.read()
+        except OSError:
+            image_data = b''
+        if len(image_data) != size or not is_valid_jpeg(image_data):
+            logger.warning(f"Discarding missing or damaged album art: {path}")
+            self.remove(collection_id)
+            return None
+        return image_data, json.loads(album_info)
+
+    def find_album(self, artist: str, album: str) -> Optional[Tuple[bytes, dict]]:
+        '''Look up art by the normalized artist and album names of a played track'''
+        if not album:
+            # title only lookups aren't specific enough to skip the search
+            return None
+        with self.lock:
+            row = self.conn.execute('''SELECT collection_id FROM albums WHERE artist = ? AND album = ?''',
+                                    (artist, album)).fetchone()
+        if row is None:
+            return None
+        return self.find(row[0])
+
+    def add_album(self, artist: str, album: str, collection_id):
+        '''Remember which collectionId a normalized artist/album resolved to'''
+        if not album:
+            return
+        with self.lock:
+            self.conn.execute('''INSERT OR REPLACE INTO albums (artist, album, collection_id) VALUES (?, ?, ?)''',
+                              (artist, album, str(collection_id)))
+            self.conn.commit()
+
+    def save(self, image_data: bytes, album_info: dict, dest_path: str) -> bool:
+        '''Atomically write the image to dest_path and add it to the index'''
+        if not is_valid_jpeg(image_data):
+            logger.error(f"Not saving incomplete album art for {album_info.get('collectionId')}")
+            return False
+        atomic_write(dest_path, image_data, fsync=True)
+        info = {field: album_info[field] for field in ALBUM_FIELDS if field in album_info}
+        with self.lock:
+            self.conn.execute('''INSERT OR REPLACE INTO art (collection_id, path, size, album_info, created)
+                                 VALUES (?, ?, ?, ?, ?)''',
+                              (str(album_info["collectionId"]), dest_path, len(image_data), json.dumps(info), time.time()))
+            self.conn.commit()
+        logger.debug(f"Saved cover art: {dest_path}")
+        return True
+
+    def adopt(self, album_info: dict, path: str) -> Optional[bytes]:
+        '''Add art that is already on disk (but not in the index yet) to the index'''
+        try:
+            with open(path, 'rb') as file:
+                image_data = file.read()
+        except OSError:
+            return None
+        if not is_valid_jpeg(image_data):
+            return None
+        info = {field: album_info[field] for field in ALBUM_FIELDS if field in album_info}
+        with self.lock:
+            self.conn.execute('''INSERT OR REPLACE INTO art (collection_id, path, size, album_info, created)
+                                 VALUES (?, ?, ?, ?, ?)''',
+                              (str(album_info["collectionId"]), path, len(image_data), json.dumps(info), time.time()))
+            self.conn.commit()
+        logger.debug(f"Added existing cover art to the index: {path}")
+        return image_data
+
+    def remove(self, collection_id):
+        with self.lock:
+            self.conn.execute('''DELETE FROM art WHERE collection_id = ?''', (str(collection_id),))
+            self.conn.execute('''DELETE FROM albums WHERE collection_id = ?''', (str(collection_id),))
+            self.conn.commit()
+
+    def close_connection(self):
+        self.conn.close()
@@ -1,12 +1,26 @@
 import os, unicodedata, re
 from get_cover_art.apple_downloader import AppleDownloader
+from get_cover_art.art_store import ArtStore
+from get_cover_art.http_client import HttpClient
+from get_cover_art.lookup_cache import LookupCache
 from get_cover_art.meta import Meta
+from get_cover_art.rate_limiter import RateLimiter
+from typing import Optional, Tuple
 
 DEFAULTS = {
     "art_size": "720",
     "art_quality": "0", # falls back on default quality
     "art_dest_filename": "{artist} - {album_or_title}.jpg",
-    "throttle": 3,
+    "throttle": 3, # seconds of backoff after the first throttled response, doubles on each retry
+    "rate_limit": 20, # requests per minute per host
+    "rate_burst": 6,
+    "max_backoff": 60, # seconds
+    "max_wait": 10, # seconds a lookup may wait on the rate limiter before giving up
+    "search_workers": 3, # concurrent iTunes searches per lookup, 0 searches one at a time
+    "connect_timeout": 5, # seconds
+    "read_timeout": 15, # seconds
+    "cache_ttl": 30 * 24 * 3600, # seconds to keep a matched lookup
+    "negative_cache_ttl": 24 * 3600, # seconds to remember that an album had no match
 }
 
 # anotherhobby: this was sourced and modified from the repository below for NowPlayingDisplay: 
@@ -14,7 +28,9 @@ DEFAULTS = {
 
 
 class CoverFinder(object):
-    def __init__(self, debug: bool = False):
+    def __init__(self, debug: bool = False, cache_path: str = None, store_path: str = None, on_download=None,
+                 max_wait: Optional[float] = DEFAULTS["max_wait"]):
+        # max_wait=None queues on the rate limiter for as long as it takes, for batch jobs
         self.art_size = int(DEFAULTS.get('art_size'))
         self.art_quality = int(DEFAULTS.get('art_quality'))
         self.art_dest_filename = DEFAULTS.get('art_dest_filename')
@@ -23,16 +39,35 @@ class CoverFinder(object):
         self.external_art_mode = None
         self.external_art_filename = None
         throttle = float(DEFAULTS.get('throttle'))
-        self.downloader = AppleDownloader(self.debug, throttle, self.art_size, self.art_quality)
-        self.force = True
+        self.cache = None
+        if cache_path:
+            self.cache = LookupCache(cache_path, float(DEFAULTS.get('cache_ttl')), float(DEFAULTS.get('negative_cache_ttl')))
+        self.store = ArtStore(store_path) if store_path else None
+        search_workers = int(DEFAULTS.get('search_workers'))
+        # one pooled client for every request made while finding art and album data
+        self.http = HttpClient(float(DEFAULTS.get('connect_timeout')), float(DEFAULTS.get('read_timeout')),
+                               pool_size=max(search_workers, 1) + 2)
+        self.limiter = RateLimiter(float(DEFAULTS.get('rate_limit')) / 60, int(DEFAULTS.get('rate_burst')),
+                                   throttle, float(DEFAULTS.get('max_backoff')))
+        self.downloader = AppleDownloader(self.debug, throttle, self.art_size, self.art_quality, self.cache, self.store,
+                                          search_workers, self.http, self.limiter,
+                                          float(max_wait) if max_wait is not None else None,
+                                          on_download=on_download)
+        self.force = False # re-download art even if it's already in the art store
         self.files_to_delete = set([])
 
+    def lookup_key(self, meta: Meta) -> Tuple[str, str, str]:
+        '''The normalized (artist, album, title) that lookups are cached and stored under'''
+        return self.downloader._cache_key(meta)
+
     def download(self, meta: Meta, art_path: str) -> bool:
-        if self.force or not os.path.exists(art_path):
-            return self.downloader.download(meta, art_path)
-        elif self.debug:
-            print(f"Skipping existing download for {art_path}")
-        return True
+        return self.downloader.download(meta, art_path, self.force)
+
+    def find(self, meta: Meta, art_path: str):
+        return self.downloader.find(meta, art_path, self.force)
+
+    def fetch_art(self, meta: Meta, art: str, album_info: dict, art_path: str):
+        return self.downloader.fetch_art(meta, art, album_info, art_path)
 
     def slugify(self, value: str, has_extension=True) -> str:
         """
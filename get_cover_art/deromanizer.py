@@ -1,15 +1,19 @@
 import re
+from functools import lru_cache
 
 # anotherhobby: this was sourced from the repository below for NowPlayingDisplay: 
 #                     https://github.com/regosen/get_cover_art
 
+ROMAN_PATTERN = re.compile(r"^[I|V|X|L|C|D|M]+$", flags=re.IGNORECASE)
+
 # based on https://www.tutorialspoint.com/roman-to-integer-in-python
 class DeRomanizer(object):
-    def __init__(self):
+    def __init__(self, cache_size: int = 1024):
         self.romans = {'I':1,'V':5,'X':10,'L':50,'C':100,'D':500,'M':1000,'IV':4,'IX':9,'XL':40,'XC':90,'CD':400,'CM':900}
+        self._cached_convert_all = lru_cache(maxsize=cache_size)(self._convert_all)
 
     def convert_word(self, word: str) -> str:
-        if not re.match(r"^[I|V|X|L|C|D|M]+$", word, flags=re.IGNORECASE):
+        if not ROMAN_PATTERN.match(word):
             return word
 
         i = 0
@@ -25,5 +29,8 @@ class DeRomanizer(object):
         return str(num)
 
     def convert_all(self, field: str) -> str:
+        return self._cached_convert_all(field)
+
+    def _convert_all(self, field: str) -> str:
         converted = [self.convert_word(word) for word in field.split()]
         return ' '.join(converted)
@@ -0,0 +1,35 @@
+import logging
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.55 Safari/537.36"
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient(object):
+    '''Shared HTTP client for searches, art downloads and album page scraping.
+    Connections (and their TLS sessions) are kept alive and reused per host,
+    every request has a timeout, and responses can be gzip compressed.'''
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 15, pool_size: int = 4):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept-Encoding": "gzip, deflate",
+        })
+        # one pool per host, sized for the concurrent search workers
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        logger.debug(f"GET {urlparse(url).netloc}{urlparse(url).path}")
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        self.session.close()
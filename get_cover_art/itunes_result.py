@@ -0,0 +1,41 @@
+import json
+
+# the album fields from an iTunes search result that are used after a search
+ALBUM_FIELDS = ("artistName", "collectionName", "collectionId", "artworkUrl100", "releaseDate", "collectionViewUrl", "trackName")
+
+
+class AlbumResult(object):
+    '''Compact iTunes search result holding only ALBUM_FIELDS.
+    Supports the read-only parts of the dict interface so it can be used wherever
+    a result dict was used before.'''
+    __slots__ = ALBUM_FIELDS
+
+    def __init__(self, result: dict):
+        for field in ALBUM_FIELDS:
+            setattr(self, field, result.get(field))
+
+    def get(self, field: str, default=None):
+        value = getattr(self, field, None) if field in ALBUM_FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, field: str):
+        value = self.get(field)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field: str) -> bool:
+        return self.get(field) is not None
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in ALBUM_FIELDS if getattr(self, field) is not None}
+
+    def __repr__(self) -> str:
+        return f"AlbumResult({self.to_dict()})"
+
+
+def parse_search_response(text: str) -> dict:
+    '''Decode an iTunes search response, keeping the result count and the album fields of each result'''
+    data = json.loads(text)
+    results = [AlbumResult(result) for result in data.get("results", ())]
+    return {"resultCount": data.get("resultCount", len(results)), "results": results}
@@ -0,0 +1,87 @@
+import json
+import logging
+import sqlite3
+import time
+from threading import Lock
+from typing import Optional
+
+from get_cover_art.itunes_result import ALBUM_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+class LookupCache(object):
+    '''Persistent cache of AppleDownloader search results, keyed by the normalized
+    artist/album/title of the track that was looked up. Albums that could not be
+    matched are cached too (for a shorter time) so they don't repeat every search.'''
+
+    def __init__(self, db_path: str, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = Lock()
+        # the cache is shared by the display loop and the API/worker threads
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.create_table()
+
+    def create_table(self):
+        with self.lock:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS lookups (
+                                    artist TEXT,
+                                    album TEXT,
+                                    title TEXT,
+                                    matched INTEGER,
+                                    collection_id TEXT,
+                                    art_url TEXT,
+                                    album_info TEXT,
+                                    created REAL,
+                                    PRIMARY KEY (artist, album, title)
+                                )''')
+            self.conn.commit()
+
+    def get(self, artist: str, album: str, title: str) -> Optional[dict]:
+        '''Returns the cached entry, or None if there is no entry or it has expired.
+        Entries are dicts with "matched", "art_url" and "album_info" keys.'''
+        with self.lock:
+            row = self.conn.execute('''SELECT matched, art_url, album_info, created FROM lookups
+                                       WHERE artist = ? AND album = ? AND title = ?''',
+                                    (artist, album, title)).fetchone()
+        if row is None:
+            return None
+        (matched, art_url, album_info, created) = row
+        ttl = self.ttl if matched else self.negative_ttl
+        if time.time() - created > ttl:
+            logger.debug(f"Expired lookup cache entry: {artist}, {album}, {title}")
+            return None
+        return {
+            "matched": bool(matched),
+            "art_url": art_url,
+            "album_info": json.loads(album_info) if album_info else {},
+        }
+
+    def put(self, artist: str, album: str, title: str, art_url: str, album_info: dict):
+        '''Cache a successful lookup, keeping only the album fields that are used later'''
+        info = {field: album_info[field] for field in ALBUM_FIELDS if field in album_info}
+        self._store(artist, album, title, True, str(info.get("collectionId", "")), art_url, json.dumps(info))
+
+    def put_miss(self, artist: str, album: str, title: str):
+        '''Cache a lookup that had no matching album'''
+        self._store(artist, album, title, False, "", "", "")
+
+    def purge(self):
+        '''Remove all expired entries'''
+        now = time.time()
+        with self.lock:
+            self.conn.execute('''DELETE FROM lookups WHERE (matched = 1 AND created < ?) OR (matched = 0 AND created < ?)''',
+                              (now - self.ttl, now - self.negative_ttl))
+            self.conn.commit()
+
+    def _store(self, artist, album, title, matched, collection_id, art_url, album_info):
+        with self.lock:
+            self.conn.execute('''INSERT OR REPLACE INTO lookups
+                                 (artist, album, title, matched, collection_id, art_url, album_info, created)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                              (artist, album, title, int(matched), collection_id, art_url, album_info, time.time()))
+            self.conn.commit()
+
+    def close_connection(self):
+        self.conn.close()
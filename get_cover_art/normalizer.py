@@ -1,11 +1,15 @@
 import re
+from functools import lru_cache
 
 # anotherhobby: this was sourced from the repository below for NowPlayingDisplay: 
 #                     https://github.com/regosen/get_cover_art
 
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+DISC_PATTERN = re.compile(r" [\(\[{]disc [\d|I|V|X]+[}\)\]]", flags=re.IGNORECASE)
+
 
 class Normalizer(object):
-    def __init__(self):
+    def __init__(self, cache_size: int = 2048):
         self.substitutions = {
              # make sure dashes create spaces instead of joining words
             '-': ' ',
@@ -14,31 +18,38 @@ class Normalizer(object):
             # '^the ': '',
             '^a ': '',
         }
-        
+        # compile the substitutions once, they are applied in order on every call
+        self.patterns = [(re.compile(key, flags=re.IGNORECASE), value) for (key, value) in self.substitutions.items()]
+        # the same artist and album names are normalized over and over, so memoize them
+        self._cached_normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
     def normalize(self, field: str) -> str:
+        return self._cached_normalize(field)
+
+    def _normalize(self, field: str) -> str:
         # this must come before removing punctuation
-        for (key, value) in self.substitutions.items():
-            field = re.sub(key, value, field, flags=re.IGNORECASE)
+        for (pattern, value) in self.patterns:
+            field = pattern.sub(value, field)
         
         # remove punctuation
-        field = re.sub(r'[^\w\s]', '', field)
+        field = PUNCTUATION_PATTERN.sub('', field)
 
         # splitting + rejoining standardizes whitespace to a single space between words
         return ' '.join(field.split()).lower()
 
 
 class ArtistNormalizer(Normalizer):
-    def normalize(self, artist: str) -> str:
+    def _normalize(self, artist: str) -> str:
         # If the artist name has a comma, strip it and swap the string segments.
         # e.g. "Beatles, The" -> "The Beatles", "Bowie, David" -> "David Bowie"
         (last, _sep, first) = (artist or '').partition(',')
         if first:
             artist = f"{first.strip()} {last.strip()}"
-        return super().normalize(artist)
+        return super()._normalize(artist)
 
 
 class AlbumNormalizer(Normalizer):
-    def normalize(self, album: str) -> str:
+    def _normalize(self, album: str) -> str:
         # strip "(disc 1)", etc. from album names
-        album = re.sub(r" [\(\[{]disc [\d|I|V|X]+[}\)\]]", "", (album or ''), flags=re.IGNORECASE)
-        return super().normalize(album)
+        album = DISC_PATTERN.sub("", (album or ''))
+        return super()._normalize(album)
@@ -0,0 +1,117 @@
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = "ok"
+STATUS_QUEUED = "queued"
+STATUS_THROTTLED = "throttled"
+
+
+class Throttled(Exception):
+    '''Raised when a request can't be sent within the time the caller is willing to wait'''
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} is rate limited, retry in {retry_in:.1f} seconds")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class _Bucket(object):
+    def __init__(self, capacity: float):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0 # set when the server has throttled us
+        self.failures = 0 # consecutive throttled responses, drives the backoff
+        self.waiting = 0 # requests sleeping for their turn
+
+
+class RateLimiter(object):
+    '''Per-host token bucket shared by every thread that makes requests.
+    Requests are spaced out before the server has to throttle them, and when it
+    does anyway (403/429) the host is blocked for the Retry-After time or for a
+    bounded exponential backoff with jitter.'''
+
+    def __init__(self, rate: float, burst: int, backoff: float, max_backoff: float):
+        self.rate = rate # tokens per second
+        self.capacity = float(burst)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+        self.lock = Lock()
+
+    def _bucket(self, host: str) -> _Bucket:
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = _Bucket(self.capacity)
+        return bucket
+
+    def acquire(self, host: str, max_wait: Optional[float] = None):
+        '''Wait for a token for host. Raises Throttled instead of waiting longer than max_wait.'''
+        with self.lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            # take the token now, a negative balance is the queue of requests ahead of this one
+            bucket.tokens -= 1
+            wait = max(-bucket.tokens / self.rate, bucket.blocked_until - now, 0)
+            if max_wait is not None and wait > max_wait:
+                bucket.tokens += 1
+                raise Throttled(host, wait)
+            bucket.waiting += 1
+        try:
+            if wait > 0:
+                logger.debug(f"Waiting {wait:.2f} seconds for a {host} request slot")
+                time.sleep(wait)
+        finally:
+            with self.lock:
+                bucket.waiting -= 1
+
+    def throttled(self, host: str, retry_after: Optional[str] = None) -> float:
+        '''Record a throttled response from host, returns how long the host is blocked for'''
+        with self.lock:
+            bucket = self._bucket(host)
+            bucket.failures += 1
+            delay = self._parse_retry_after(retry_after)
+            if delay is None:
+                delay = min(self.max_backoff, self.backoff * 2 ** (bucket.failures - 1))
+                # jitter keeps the concurrent workers from retrying in lockstep
+                delay = random.uniform(delay / 2, delay)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + delay)
+            # start over with an empty bucket once the block is lifted
+            bucket.tokens = min(bucket.tokens, 0)
+            return delay
+
+    def succeeded(self, host: str):
+        with self.lock:
+            self._bucket(host).failures = 0
+
+    def status(self, host: str) -> str:
+        '''Returns ok, queued (requests are waiting for a slot) or throttled (blocked by the server)'''
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                return STATUS_OK
+            if bucket.blocked_until > time.monotonic():
+                return STATUS_THROTTLED
+            if bucket.waiting > 0:
+                return STATUS_QUEUED
+            return STATUS_OK
+
+    def _parse_retry_after(self, retry_after: Optional[str]) -> Optional[float]:
+        # Retry-After is either a number of seconds or an HTTP date
+        if not retry_after:
+            return None
+        try:
+            return min(self.max_backoff, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after).timestamp()
+        except (TypeError, ValueError):
+            return None
+        return min(self.max_backoff, max(0.0, retry_at - time.time()))
@@ -0,0 +1,123 @@
+import logging
+from typing import List, Optional
+
+from get_cover_art.normalizer import AlbumNormalizer, ArtistNormalizer
+
+logger = logging.getLogger(__name__)
+
+# how much each part of a candidate counts towards its confidence, adds up to 1
+WEIGHTS = {
+    "artist": 0.40,
+    "album": 0.35,
+    "title": 0.15,
+    "release": 0.05,
+    "rank": 0.05, # iTunes' own relevance order
+}
+
+
+class Candidate(object):
+    '''A search result with its names tokenized once, ready to be scored'''
+    __slots__ = ("result", "rank", "artist_tokens", "album", "album_tokens", "title_tokens", "release_date")
+
+    def __init__(self, result, rank: int, artist: str, album: str, title: str):
+        self.result = result
+        self.rank = rank
+        self.artist_tokens = frozenset(artist.split())
+        self.album = album
+        self.album_tokens = frozenset(album.split())
+        self.title_tokens = frozenset(title.split())
+        self.release_date = result.get('releaseDate') or ""
+
+
+class Match(object):
+    __slots__ = ("result", "confidence", "scores")
+
+    def __init__(self, result, confidence: float, scores: dict):
+        self.result = result
+        self.confidence = confidence
+        self.scores = scores
+
+    def __repr__(self) -> str:
+        return f"Match({self.confidence:.2f}, {self.scores}, {self.result})"
+
+
+class CandidateScorer(object):
+    '''Scores every result of a search against the query and returns the best one.
+    A candidate has to pass the same word overlap thresholds the old first-pass
+    matching used, its confidence then decides between the candidates that pass.'''
+
+    def __init__(self, artist_normalizer: ArtistNormalizer, album_normalizer: AlbumNormalizer, threshold: float = 0.75):
+        self.artist_normalizer = artist_normalizer
+        self.album_normalizer = album_normalizer
+        self.threshold = threshold
+
+    def _overlap(self, tokens1: frozenset, tokens2: frozenset) -> float:
+        '''Sometimes artists are not in the same order or one might be missing,
+        so compare the share of words the shorter value has in common with the other.'''
+        shortest = min(len(tokens1), len(tokens2))
+        if shortest == 0:
+            return 0.0
+        return len(tokens1 & tokens2) / shortest
+
+    def tokenize(self, results: list) -> List[Candidate]:
+        return [
+            Candidate(
+                result,
+                rank,
+                self.artist_normalizer.normalize(result.get('artistName')),
+                self.album_normalizer.normalize(result.get('collectionName')),
+                self.album_normalizer.normalize(result.get('trackName')),
+            )
+            for (rank, result) in enumerate(results)
+        ]
+
+    def score(self, candidates: List[Candidate], artist: str, album: str, title: str) -> List[Match]:
+        '''Score all candidates against a normalized query, returns the ones that pass best first'''
+        artist_tokens = frozenset(artist.split())
+        album_tokens = frozenset(album.split())
+        title_tokens = frozenset(title.split())
+        title_only = len(album) == 0
+        if title_only:
+            # if no album name provided, prefer the earliest release
+            by_date = sorted(candidates, key=lambda c: c.release_date)
+            release_rank = {id(c): index for (index, c) in enumerate(by_date)}
+        count = len(candidates)
+
+        matches = []
+        for candidate in candidates:
+            artist_score = self._overlap(candidate.artist_tokens, artist_tokens)
+            if artist_score <= self.threshold:
+                continue
+            title_score = self._overlap(candidate.title_tokens, title_tokens)
+            if title_only:
+                # without an album the track title has to match instead, and counts in its place
+                if title_score <= self.threshold:
+                    continue
+                album_score = title_score
+                release_score = 1 - release_rank[id(candidate)] / count
+            else:
+                album_score = self._overlap(candidate.album_tokens, album_tokens)
+                if album_score <= self.threshold:
+                    continue
+                # an exact album name always beats a partial one
+                album_score = 1.0 if candidate.album == album else album_score * 0.9
+                release_score = 1.0
+            scores = {
+                "artist": artist_score,
+                "album": album_score,
+                "title": title_score,
+                "release": release_score,
+                "rank": 1 - candidate.rank / count,
+            }
+            confidence = sum(WEIGHTS[key] * value for (key, value) in scores.items())
+            matches.append(Match(candidate.result, confidence, scores))
+        # the release date decides between equally confident matches, the earliest wins
+        matches.sort(key=lambda match: (match.confidence, match.scores["release"]), reverse=True)
+        return matches
+
+    def best(self, results: list, artist: str, album: str, title: str) -> Optional[Match]:
+        matches = self.score(self.tokenize(results), artist, album, title)
+        if not matches:
+            return None
+        logger.debug(f"Best of {len(matches)} matching candidates: {matches[0]}")
+        return matches[0]
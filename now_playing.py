@@ -1,41 +1,85 @@
+import npstartup # first, so --profile-startup can time the other imports
+import argparse
 import io
-import json
 import logging
 import os
-import re
 import signal
 import time
 from threading import Thread
-from tkinter import Tk
 
-import requests
-from bs4 import BeautifulSoup
-from flask import Flask, render_template, jsonify, request
-from PIL import Image, ImageTk
-from thefuzz import process
+from PIL import Image
 
-from get_cover_art.cover_finder import DEFAULTS, CoverFinder, Meta
+from get_cover_art.meta import Meta
+from npalbumdata import AlbumDataCache, parse_lookup_response, parse_serialized_server_data, scan_serialized_server_data
+from npcommands import UICommandQueue
+from npart import ArtDerivatives, Artwork, ArtworkCache, load_display_art, screensaver_tile_size
+from nppipeline import AlbumFetchPipeline, STAGE_ART, STAGE_SEARCH, STAGE_TRACKS, album_key
 from npstate import NowPlayingState
-from npdisplay import NowPlayingDisplay
 from npmusicdata import MusicDataStorage
 from nputils import display_on, check_xrandr
 
+# tkinter and npdisplay are only imported for the window, --headless draws with Pillow alone
+# Flask, requests, thefuzz, musicbrainzngs and get_cover_art are imported when first used,
+# after the first frame is on the screen (see start_services and start_api)
+
 try:
     from npsettings_local import DEBUG
 except ImportError:
     from npsettings import DEBUG
 
+try:
+    from npsettings_local import artwork_cache_mb
+except ImportError:
+    from npsettings import artwork_cache_mb
+
+npstartup.mark("imports done")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-tk = Tk()
-npui = NowPlayingDisplay(tk, tk.winfo_screenwidth(), tk.winfo_screenheight())
+parser = argparse.ArgumentParser(description="Now Playing Display")
+parser.add_argument("--headless", metavar="OUTPUT",
+                    help="draw without X11 or Tk, to a framebuffer device (/dev/fb0) or a PNG file")
+parser.add_argument("--size", default="800x480", help="screen size for --headless PNG output, WIDTHxHEIGHT")
+(args, _unknown) = parser.parse_known_args()
+HEADLESS = args.headless is not None
+
+if HEADLESS:
+    from npframebuffer import create_display
+    (width, height) = (int(value) for value in args.size.lower().split("x"))
+    (tk, npui) = create_display(args.headless, (width, height))
+else:
+    from tkinter import Tk
+    from npdisplay import NowPlayingDisplay
+    tk = Tk()
+    npui = NowPlayingDisplay(tk, tk.winfo_screenwidth(), tk.winfo_screenheight())
+ui = UICommandQueue(tk)
 state = NowPlayingState()
-finder = CoverFinder(debug=DEBUG)
-npapi = Flask(__name__, template_folder='www')
-
+SCREEN_HEIGHT = tk.winfo_screenheight()
+npstartup.mark("display created")
 CODE_PATH = os.path.dirname(os.path.abspath(__file__))
+ART_PATH = os.path.join(CODE_PATH, 'album_images/')
+if not os.path.exists(ART_PATH):
+    os.makedirs(ART_PATH)
+derivatives = ArtDerivatives(
+    ART_PATH,
+    display_size=SCREEN_HEIGHT,
+    tile_size=screensaver_tile_size(tk.winfo_screenwidth(), SCREEN_HEIGHT)
+)
+album_cache = AlbumDataCache(os.path.join(CODE_PATH, 'lookup_cache.db'))
+# the album lookup services are created by start_services()
+finder = None
+musicbrainz = None
+pipeline = None
+album_job = None # the album lookup for what's currently playing
+ALBUM_DEBOUNCE = 500 # ms an album has to keep playing before it's looked up
+old_title = ""
+requested_album = "" # album of the last lookup, so every track of an album doesn't start one
+fetch_timer = None # pending debounced album lookup
+npapi = None # the Flask app, created by start_api()
+
 missing_art = os.path.join(CODE_PATH, 'images/missing_art.png')
+missing_artwork = None
+artwork_cache = ArtworkCache(artwork_cache_mb)
 npui.set_debug(DEBUG)
 state.set_debug(DEBUG)
 running = True
@@ -52,120 +96,164 @@ def display_setup():
     logger.debug(f"Display setup complete. Resolution: {tk.winfo_screenwidth()}x{tk.winfo_screenheight()}")
 
 
-def fetch_album():
-    ''' Get album art and data from Apple Music '''
+def show_client_album():
+    ''' Show the album name from the client until the search has found the real one '''
+    npui.set_album(split_lines(state.get_album()))
+    state.set_tracks([])
+    npui.set_album_released("")
+    npui.set_album_duration("")
+    # an album played recently gets its art back right away
+    artwork = artwork_cache.get(album_key(Meta(artist=state.get_artist_str(), album=state.get_album(), title="")))
+    if artwork is not None:
+        logger.debug(f"Using cached art for {state.get_album()}")
+        npui.set_artwork(artwork.active, artwork.get_inactive)
+
+
+def start_services():
+    ''' Create the album lookup services, deferred until the first frame is on the screen '''
+    global finder, musicbrainz, pipeline
+    if pipeline is not None:
+        return
+    from get_cover_art.cover_finder import DEFAULTS, CoverFinder
+    from npmb import MusicBrainzSearch
     DEFAULTS['art_size'] = "1000"
-    artist = state.get_artist_str()
-    album = state.get_album()
-    meta = Meta(artist=artist, album=album, title=state.get_title())
-    art_path = os.path.join(CODE_PATH, f'album_images/')
-    if not os.path.exists(art_path):
-        os.makedirs(art_path)
-    album_art, data = finder.download(meta, art_path)
-
-    if album_art:
-        state.set_album_id(data.get('collectionId', ""))
-        album_title = data.get('collectionName', album)
+    finder = CoverFinder(
+        debug=DEBUG,
+        cache_path=os.path.join(CODE_PATH, 'lookup_cache.db'),
+        store_path=os.path.join(ART_PATH, 'art_index.db'),
+        on_download=lambda album_id, image_data: derivatives.generate(album_id, image_data)
+    )
+    musicbrainz = MusicBrainzSearch(debug=DEBUG, cache_path=os.path.join(CODE_PATH, 'lookup_cache.db'), art_path=ART_PATH,
+                                    store=finder.store)
+    pipeline = AlbumFetchPipeline(finder, ART_PATH, prepare_album_art, apple_album_data, fallback=musicbrainz,
+                                  notify=lambda: ui.post(apply_album_results))
+    npstartup.mark("album lookup services created")
+
+
+def start_album_fetch():
+    ''' Start getting the album art and data in the background, results arrive through the pipeline '''
+    global album_job
+    start_services()
+    meta = Meta(artist=state.get_artist_str(), album=state.get_album(), title=state.get_title())
+    job = pipeline.submit(meta, state.get_art_url(), state.get_duration())
+    if album_job is not None and album_job is not job:
+        # the previous album was skipped past, don't spend requests on it
+        pipeline.cancel(album_job)
+    album_job = job
+
+
+def cancel_album_fetch():
+    global album_job
+    if pipeline is not None:
+        pipeline.cancel(album_job)
+    album_job = None
+
+
+def apply_album_result(job, stage, result):
+    ''' Apply a completed pipeline stage to the display, runs on the display thread '''
+    if album_job is None or job.job_id != album_job.job_id or job.meta.album != state.get_album():
+        logger.debug(f"Ignoring {stage} result of old album job {job.job_id}")
+        return
+    album = job.meta.album
+    if stage == STAGE_SEARCH:
+        if result is None:
+            logger.debug(f"No album found, iTunes status: {finder.downloader.throttle_status()}")
+            state.set_album_id("")
+            return
+        state.set_album_id(result.get('collectionId', ""))
+        album_title = result.get('collectionName', album)
         if "*" in album_title: # apple music uses a * on explicit titles
             if "*" not in album:
                 album_title = album
-
         # use the artist name from the Apple Music album data if available
-        apple_artist = data.get('artistName', "")
+        apple_artist = result.get('artistName', "")
         if apple_artist != "":
             state.set_artist(apple_artist.split(","))
-        album_url = data.get("collectionViewUrl", "")
-        return album_art, album_title, album_url
-    else:
-        return None
+        npui.set_album(split_lines(album_title))
+    elif stage == STAGE_ART:
+        if result is None:
+            logger.debug("No album art found, using default")
+            state.set_displayed_album("missing art")
+            artwork = mk_album_art(missing_art)
+            npui.set_artwork(artwork, artwork)
+        else:
+            # art the worker found in the cache is ready to show, otherwise it still needs a PhotoImage
+            artwork = result if isinstance(result, Artwork) else Artwork(result, npui.make_image)
+            album_id = state.get_album_id()
+            artwork_cache.put(str(album_id) if album_id else job.key, artwork, aliases=[job.key])
+            npui.set_artwork(artwork.active, artwork.get_inactive)
+            if album_id:
+                state.set_displayed_album(album)
+            logger.debug(f"set image for album: {album}")
+    elif stage == STAGE_TRACKS:
+        state.set_tracks(result["tracks"])
+        npui.set_album_released(result["released"])
+        npui.set_album_duration(result["duration"])
+        update_track()
 
 
 def fetch_serialized_server_data(url):
     '''
     Fetches the serialized server data from the given URL
     '''
+    import requests
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        script_tag = soup.find('script', {'type': 'application/json', 'id': 'serialized-server-data'})
-        if script_tag:
-            serialized_data = script_tag.string
-            return serialized_data
-        else:
+        response = finder.http.get(url, stream=True)
+        try:
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
+            # stop downloading as soon as the script tag has been read
+            serialized_data, page = scan_serialized_server_data(response.iter_content(chunk_size=16384, decode_unicode=True))
+        finally:
+            response.close()
+        if serialized_data is None:
+            # the page markup changed, fall back on a full parse of the page
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(page, 'html.parser')
+            script_tag = soup.find('script', {'type': 'application/json', 'id': 'serialized-server-data'})
+            serialized_data = script_tag.string if script_tag else None
+        if serialized_data is None:
             logger.error("Serialized server data not found on the page.")
-            return None
+        return serialized_data
 
     except requests.exceptions.RequestException as e:
-        logger.error("Error fetching data:", e)
+        logger.error(f"Error fetching data: {e}")
         return None
 
 
-def apple_album_data(album_url : str) -> dict:
-    ''' Get album data from the Apple Music album page '''
-    serialized_data = fetch_serialized_server_data(album_url)
-    track_data = []
-    released = ""
-    duration = ""
-    if serialized_data is not None:
-        sections = json.loads(serialized_data)[0]["data"]["sections"]
-        for item in sections:
-            if item["itemKind"] == "trackLockup":
-                for track in item["items"]:
-                    track_data.append(track["title"])
-            if item["itemKind"] == "containerDetailTracklistFooterLockup":
-                try:
-                    description = item['items'][0]['description'].split("\n")
-                    released = description[0]
-                    duration = description[1].split("Songs, ")[1]
-                except Exception as e:
-                    logger.error(e)
-                    pass
-    return {"tracks": track_data, "released": released, "duration": duration}
-
-
-def current_track():
-    ''' Get the current track number out of the list of tracks '''
-    if len(state.get_tracks()) == 0:
-        return ""
-
-    # use fuzzy to match the current track to the list of tracks
-    track = process.extractOne(state.get_title(), state.get_tracks())
-    if track is not None:
-        # get the index of the track in the list of tracks
-        index = state.get_tracks().index(track[0]) + 1
-        return f"{index} of {len(state.get_tracks())}"
-
-    # old method of matching tracks, will be removed in the future if fuzzy matching works well
-    tracks = state.get_tracks()
-    for index, name in enumerate(tracks, start=1):
-        if name.lower() == state.get_title().lower():
-            return f"{index} of {len(tracks)}"
-        if name.lower() in state.get_title().lower():
-            return f"{index} of {len(tracks)}"
-        if strip_paren_words(name.lower()) == strip_paren_words(state.get_title().lower()):
-            return f"{index} of {len(tracks)}"
-
-    return f"? of {len(tracks)}"
+def apple_album_data(album_url : str, album_id : str = "") -> dict:
+    ''' Get album data from the album data cache, the iTunes lookup API, or the Apple Music album page '''
+    album_data = {"tracks": [], "released": "", "duration": ""}
+    if album_id:
+        cached = album_cache.get(album_id)
+        if cached is not None:
+            logger.debug(f"Album data cache hit for {album_id}")
+            return cached
+        # the lookup API returns the track list as a few KB of JSON
+        try:
+            album_data = parse_lookup_response(finder.downloader.lookup_tracks(album_id))
+        except Exception as e:
+            logger.error(f"Error reading the iTunes lookup for {album_id}: {e}")
+    if not album_data["tracks"] and album_url:
+        # fall back on scraping the (much larger) album page
+        album_data = parse_serialized_server_data(fetch_serialized_server_data(album_url))
+    if album_id and album_data["tracks"]:
+        album_cache.put(album_id, album_data)
+    return album_data
 
 
 def split_lines(text):
-    # if the title has parentheses, split the title into two lines with the parentheses on the second line
-    if "(" in text:
-        text = text.split(" (")
+    # if the title has parentheses, split the title into two lines with the parentheses on the second line,
+    # any further breaks are made by the display so the text fits its label
+    if " (" in text:
+        text = text.split(" (", 1)
         return f"{text[0]}\n({text[1]}"
     if ": " in text:
-        text = text.split(": ")
+        text = text.split(": ", 1)
         return f"{text[0]}:\n{text[1]}"
     return text
 
 
-def strip_paren_words(value: str) -> str:
-    '''Remove words in parentesis from the string'''
-    result = re.sub(r'\([^)]*\)', '', value)
-    return result.strip()
-
-
 def clear_display():
     '''Clear all text fields on the display'''
     logger.debug("clearing display")
@@ -178,127 +266,140 @@ def clear_display():
     npui.set_album_released("")
     npui.set_album_duration("")
     state.set_displayed_album("missing art")
-    a, i = mk_album_art(missing_art)
-    npui.set_artwork(a, a)
-    tk.update()
+    artwork = mk_album_art(missing_art)
+    npui.set_artwork(artwork, artwork)
 
 
-def np_mainloop():
-    ''' Main loop for the Now Playing display, updates the display with new information every second'''
-    old_title = ""
-    album_for_current_art = ""
-    logger.debug("waiting for the display to be ready...")
-    display_setup()
-    clear_display()
+def update_track():
+    ''' Update the track number on the display '''
+    track = state.current_track()
+    state.set_track(track.split(" ")[0])
+    npui.set_track(track)
 
-    while running:
-        tk.update()
-        time.sleep(1)
-        # update_state checks for new API payloads and updates the state if found
-        if not state.update_state():
-            # if the player is playing and state hasn't changed, only update progress
-            if state.get_player_state() == "playing":
-                npui.set_duration(state.get_duration())
-                npui.set_elapsed(state.get_epoc_elapsed())
-            continue
-
-        try: # the player state has changed, update the display
-            
-            if state.get_player_state() == "playing":
-                npui.set_active() # set the display to active (bright)
-            else:
-                npui.set_inactive() # set the display to inactive (dim)
 
-            # update the elapsed/duration and progress bar
-            npui.set_duration(state.get_duration())
-            npui.set_elapsed(state.get_epoc_elapsed())
-
-            title = state.get_title()
-            if title != old_title:
-                # the song title has changed, update the display
-                logger.debug(f"Title has changed: {title}")
-                old_title = title
-                if title == "":
-                    clear_display()
-                    npui.start_screensaver(30)
-                    continue
-
-                # update the artist and duration on the display
-                artist_text = state.get_artist_multi_line()
-                npui.set_artist(artist_text)
-                npui.set_duration(state.get_duration())
-
-                # check if the album is still the same
-                if state.get_displayed_album() == state.get_album():
-                    logger.debug(f"Album is the same: {state.get_album()}")
-                    pass
-                else:
-                    try:
-                        # try to get the album art and data from Apple Music
-                        art, album, album_url = fetch_album()
-                        if art is not None:
-                            # set the album art to the new image
-                            a, i = mk_album_art(io.BytesIO(art))
-                            npui.set_artwork(a, i)
-                            state.set_displayed_album(state.get_album())
-                            logger.debug(f"set image for album: {state.get_album()}")
-                            album_for_current_art = album
-                            album_data = apple_album_data(album_url)
-                            state.set_tracks(album_data["tracks"])
-                            npui.set_album_released(album_data["released"])
-                            npui.set_album_duration(album_data["duration"])                            
-                        else:
-                            logger.debug("No album art found")
-                            # if album art is provided, use it for the missing art, otherwise use the default missing art
-                            if album_for_current_art != "":
-                                image_data = finder.downloader._urlopen_safe(state.get_art_url())
-                                a, i = mk_album_art(io.BytesIO(image_data))
-                                npui.set_artwork(a, i)
-                            else:
-                                logger.debug("No album art found, using default")
-                                state.set_displayed_album("missing art")
-                                a, i = mk_album_art(missing_art)
-                                npui.set_artwork(a, a)
-                            album_for_current_art = state.get_album()
-                            state.set_tracks([])
-                            npui.set_album_released("")
-                            npui.set_album_duration("") 
-
-                    except Exception as e:
-                        # generic exception handling, print the exception and continue
-                        logger.error(e)
-                        pass
-
-                    # update the album title on the display
-                    npui.set_album(split_lines(album_for_current_art))
-
-            # update the title & track on the display
-            npui.set_title(split_lines(title))
-            track = current_track()
-            state.set_track(track.split(" ")[0])
-            npui.set_track(track)
+def np_start():
+    ''' Finish setting up the display once mainloop() is running, everything after this is event driven '''
+    if not HEADLESS:
+        display_setup()
+    clear_display()
+    npstartup.mark("display cleared")
+    # the frame is drawn when Tk goes idle, everything else waits until it's on the screen
+    tk.after_idle(after_first_frame)
+
 
+def after_first_frame():
+    npstartup.mark("first frame")
+    start_services()
+    logger.info("Starting API...")
+    Thread(target=start_api).start()
+    # pick up anything posted before mainloop() started
+    ui.drain()
+
+
+def apply_album_results():
+    ''' Apply every album pipeline stage that has completed, runs on the display thread '''
+    if pipeline is None:
+        return
+    result = pipeline.get_result(timeout=0)
+    while result is not None:
+        try:
+            apply_album_result(*result)
         except Exception as e:
             logger.error(e)
+        result = pipeline.get_result(timeout=0)
 
 
-def mk_album_art(path):
-    # Resize the original image to the screen height
-    original_image = Image.open(path)
-    original_image = original_image.resize((tk.winfo_screenheight(), tk.winfo_screenheight()))
-    original_art = ImageTk.PhotoImage(original_image)
+def debounced_album_fetch():
+    global fetch_timer
+    fetch_timer = None
+    start_album_fetch()
+
+
+def update_display():
+    ''' Show a new payload from the API, runs on the display thread as soon as the payload arrives '''
+    global old_title, requested_album, fetch_timer
+    # update_state checks for new API payloads and updates the state if found
+    if not state.update_state():
+        return
+
+    try: # the player state has changed, update the display
+        
+        if state.get_player_state() == "playing":
+            npui.set_active() # set the display to active (bright)
+        else:
+            npui.set_inactive() # set the display to inactive (dim)
+
+        # update the duration, the elapsed time and progress bar follow the playback clock from here
+        npui.set_duration(state.get_duration())
+        npui.set_playback(state.get_epoc_start(), state.get_player_state() == "playing")
+
+        title = state.get_title()
+        if title != old_title:
+            # the song title has changed, update the display
+            logger.debug(f"Title has changed: {title}")
+            old_title = title
+            if fetch_timer is not None:
+                tk.after_cancel(fetch_timer)
+                fetch_timer = None
+            if title == "":
+                requested_album = ""
+                cancel_album_fetch()
+                clear_display()
+                npui.start_screensaver(30)
+                return
+
+            # update the artist and duration on the display
+            artist_text = state.get_artist_multi_line()
+            npui.set_artist(artist_text)
+            npui.set_duration(state.get_duration())
+
+            # check if the album is still the same, an album skipped back to (A, B, A) is the
+            # requested one again, its data and art come back from the caches
+            if state.get_album() == requested_album:
+                logger.debug(f"Album is the same: {state.get_album()}")
+            else:
+                # the text is updated now, the art and album data follow when they arrive
+                requested_album = state.get_album()
+                cancel_album_fetch()
+                show_client_album()
+            if state.get_album() == requested_album and album_job is None:
+                # only look up the album once the skipping has settled
+                fetch_timer = tk.after(ALBUM_DEBOUNCE, debounced_album_fetch)
+
+        # update the title & track on the display
+        npui.set_title(split_lines(title))
+        update_track()
 
-    # Create a copy of the original image
-    dimmed_image = original_image.copy()
+    except Exception as e:
+        logger.error(e)
 
-    # Apply a semi-transparent black overlay to create a dimmed effect
-    overlay = Image.new('RGBA', dimmed_image.size, (0, 0, 0, 128))  # 50% transparent black overlay
-    dimmed_image.paste(overlay, (0, 0), overlay)
 
-    # Convert the dimmed image to PhotoImage
-    dimmed_art = ImageTk.PhotoImage(dimmed_image)
+def prepare_album_art(album_id, image_data):
+    ''' Decode and size album art for the display, runs on a pipeline worker '''
+    if album_id:
+        artwork = artwork_cache.get(str(album_id))
+        if artwork is not None:
+            return artwork
+        # use the pre-sized derivative, falls back to decoding the original
+        paths = derivatives.generate(album_id, image_data, kinds=["display"])
+        if paths:
+            try:
+                image = Image.open(paths["display"])
+                image.load()
+                return image
+            except Exception as e:
+                logger.error(f"Unable to load album art derivative for {album_id}: {e}")
+    return load_display_art(io.BytesIO(image_data), SCREEN_HEIGHT)
 
-    return original_art, dimmed_art
+
+def mk_album_art(path):
+    global missing_artwork
+    if path == missing_art:
+        # the missing art is shown often enough to keep it around
+        if missing_artwork is None:
+            missing_artwork = npui.make_image(load_display_art(path, SCREEN_HEIGHT))
+        return missing_artwork
+    return npui.make_image(load_display_art(path, SCREEN_HEIGHT))
 
 
 def signal_handler(sig, frame):
@@ -310,9 +411,9 @@ def signal_handler(sig, frame):
     os._exit(0)
 
 
-@npapi.route('/update-now-playing', methods=['POST'])
 def update_now_playing():
     '''API endpoint for updating the now playing information on the display.'''
+    from flask import jsonify, request
     # if screen is powered off, just return and don't process the request
     if npui.display_check:
         if not display_on():
@@ -338,27 +439,51 @@ def update_now_playing():
                     logger.debug(f"client mismatch, wait 60s")
                     return jsonify({"message": "Client mismatch, wait 60s"}), 400
         state.add_api_payload(payload)
+        ui.post(update_display)
         return jsonify({"message": "Payload received successfully"}), 200
     else:
         logger.debug(f"invalid payload: {payload}")
         return jsonify({"message": "Invalid payload"}), 400
 
-@npapi.route('/')
 def index():
+    from flask import render_template
     return render_template('index.html')
 
-@npapi.route('/tracks')
+def album_thumbnail(album_id):
+    '''Small album art for the web pages, instead of the full size original'''
+    from flask import abort, send_file
+    path = derivatives.get(album_id, "thumb")
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='image/jpeg', max_age=86400)
+
 def tracks():
+    from flask import render_template
     data = MusicDataStorage().retrieve_tracks()
     return render_template('tracks.html', data=data)
 
-@npapi.route('/albums')
 def albums():
+    from flask import render_template
     data = MusicDataStorage().retrieve_albums()
     return render_template('albums.html', data=data)
 
+def create_api():
+    '''Create the Flask app, Flask is only imported once the display is up'''
+    from flask import Flask
+    api = Flask(__name__, template_folder='www')
+    api.add_url_rule('/update-now-playing', view_func=update_now_playing, methods=['POST'])
+    api.add_url_rule('/', view_func=index)
+    api.add_url_rule('/art/<album_id>.jpg', view_func=album_thumbnail)
+    api.add_url_rule('/tracks', view_func=tracks)
+    api.add_url_rule('/albums', view_func=albums)
+    return api
+
 def start_api():
     '''Start the Flask API to accept requests to update the now playing information.'''
+    global npapi
+    npapi = create_api()
+    npstartup.mark("API created")
+    npstartup.report()
     flask_log = logging.getLogger('werkzeug')
     flask_log.setLevel(logging.ERROR)
     npapi.run(host='0.0.0.0', port=5432, threaded=True)
@@ -369,11 +494,6 @@ if __name__ == "__main__":
     if DEBUG:
         logger.setLevel(logging.DEBUG)
 
-    logger.info("Starting API...")
-    Thread(target=start_api).start()
-
-    logger.info("Starting NowPlayingDisplay thread...")
-    Thread(target=np_mainloop).start()
-
     logger.info("Starting main display loop...")
+    tk.after(0, np_start)
     tk.mainloop()
\ No newline at end of file
@@ -0,0 +1,139 @@
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from threading import Lock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SERVER_DATA_ID = 'id="serialized-server-data"'
+SCRIPT_END = '</script>'
+
+
+class AlbumDataCache:
+    """
+    Persistent cache of the album track listings, keyed by the Apple Music collectionId.
+    Track listings don't change, so an album only has to be scraped the first time it's played.
+    """
+    def __init__(self, db_path, ttl=90 * 24 * 3600):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.create_table()
+
+    def create_table(self):
+        with self.lock:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS album_data (
+                                    album_id TEXT PRIMARY KEY,
+                                    tracks TEXT,
+                                    released TEXT,
+                                    duration TEXT,
+                                    created REAL
+                                )''')
+            self.conn.commit()
+
+    def get(self, album_id):
+        with self.lock:
+            row = self.conn.execute('''SELECT tracks, released, duration, created FROM album_data WHERE album_id = ?''',
+                                    (str(album_id),)).fetchone()
+        if row is None or time.time() - row[3] > self.ttl:
+            return None
+        return {"tracks": json.loads(row[0]), "released": row[1], "duration": row[2]}
+
+    def put(self, album_id, album_data):
+        with self.lock:
+            self.conn.execute('''INSERT OR REPLACE INTO album_data (album_id, tracks, released, duration, created)
+                                 VALUES (?, ?, ?, ?, ?)''',
+                              (str(album_id), json.dumps(album_data["tracks"]), album_data["released"],
+                               album_data["duration"], time.time()))
+            self.conn.commit()
+
+    def close_connection(self):
+        self.conn.close()
+
+
+def scan_serialized_server_data(chunks):
+    '''
+    Find the serialized-server-data script in an album page as it streams in, and stop reading
+    as soon as its closing tag arrives instead of parsing the whole page. Returns the script
+    contents and the text that was read (for the fallback parser), the contents are None if
+    the tag wasn't found.
+    '''
+    text = ""
+    marker = -1
+    start = -1
+    for chunk in chunks:
+        # start a little before the new chunk so a tag split across chunks is still found
+        previous_length = len(text)
+        text += chunk
+        if marker < 0:
+            marker = text.find(SERVER_DATA_ID, max(previous_length - len(SERVER_DATA_ID), 0))
+            if marker < 0:
+                continue
+        if start < 0:
+            tag_end = text.find('>', marker)
+            if tag_end < 0:
+                continue
+            start = tag_end + 1
+        end = text.find(SCRIPT_END, max(start, previous_length - len(SCRIPT_END)))
+        if end >= 0:
+            return text[start:end], text
+    return None, text
+
+
+def parse_serialized_server_data(serialized_data):
+    ''' Get the track list, release line and album duration out of the album page data '''
+    track_data = []
+    released = ""
+    duration = ""
+    if serialized_data is not None:
+        sections = json.loads(serialized_data)[0]["data"]["sections"]
+        for item in sections:
+            if item["itemKind"] == "trackLockup":
+                for track in item["items"]:
+                    track_data.append(track["title"])
+            if item["itemKind"] == "containerDetailTracklistFooterLockup":
+                try:
+                    description = item['items'][0]['description'].split("\n")
+                    released = description[0]
+                    duration = description[1].split("Songs, ")[1]
+                except Exception as e:
+                    logger.error(e)
+                    pass
+    return {"tracks": track_data, "released": released, "duration": duration}
+
+
+def format_album_duration(millis):
+    ''' Album length the way Apple Music shows it, e.g. "52 minutes" or "1 hour, 5 minutes" '''
+    minutes = round(millis / 60000)
+    hours = minutes // 60
+    minutes = minutes % 60
+    minutes_text = f"{minutes} minute{'' if minutes == 1 else 's'}"
+    if hours == 0:
+        return minutes_text
+    return f"{hours} hour{'' if hours == 1 else 's'}, {minutes_text}"
+
+
+def parse_lookup_response(text):
+    ''' Get the track list, release date and album duration out of an iTunes lookup response '''
+    track_data = []
+    released = ""
+    duration = ""
+    if text:
+        results = json.loads(text).get("results", [])
+        tracks = [item for item in results if item.get("wrapperType") == "track"]
+        tracks.sort(key=lambda track: (track.get("discNumber", 1), track.get("trackNumber", 0)))
+        track_data = [track.get("trackName", "") for track in tracks]
+        collection = next((item for item in results if item.get("wrapperType") == "collection"), {})
+        release_date = collection.get("releaseDate") or (tracks[0].get("releaseDate") if tracks else "")
+        if release_date:
+            try:
+                date = datetime.strptime(release_date[:10], "%Y-%m-%d")
+                released = f"{date:%B} {date.day}, {date.year}"
+            except ValueError as e:
+                logger.error(e)
+        if tracks:
+            duration = format_album_duration(sum(track.get("trackTimeMillis", 0) for track in tracks))
+    return {"tracks": track_data, "released": released, "duration": duration}
@@ -0,0 +1,186 @@
+import io
+import logging
+import math
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+
+from PIL import Image
+
+from get_cover_art.art_store import atomic_write
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = "derived"
+THUMBNAIL_SIZE = 200 # px, used by the web pages
+DIM_FACTOR = 0.5 # brightness of the inactive art, same as a 50% black overlay
+DIM_TABLE = [int(value * DIM_FACTOR) for value in range(256)] * 3 # RGB lookup table for Image.point
+ALBUM_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]+$")
+# memory used by prepared artwork: the active and inactive display images (4 bytes per pixel each
+# in Tk) and the decoded RGB image, which is kept until the inactive image has been made
+ARTWORK_BYTES_PER_PIXEL = 4 + 4 + 3
+
+
+def screensaver_tile_size(screen_width, screen_height):
+    '''Size of the screensaver grid squares, the grid follows the screen aspect ratio'''
+    gcd = math.gcd(screen_width, screen_height)
+    columns = screen_width // gcd
+    rows = screen_height // gcd
+    return min(screen_width // columns, screen_height // rows)
+
+
+def load_display_art(source, size):
+    '''
+    Decode album art straight to a size x size RGB image. JPEGs are decoded in draft mode,
+    which lets the decoder scale down by 1/2, 1/4 or 1/8 as it goes instead of decoding
+    every pixel of the full size image first.
+    '''
+    image = Image.open(source)
+    image.draft("RGB", (size, size))
+    image = image.convert("RGB")
+    if image.size != (size, size):
+        image = image.resize((size, size), Image.BICUBIC)
+    return image
+
+
+def dim_art(image):
+    '''The inactive version of the art, one lookup table pass over the pixels'''
+    return image.point(DIM_TABLE)
+
+
+class Artwork:
+    """Album art prepared for the display, the inactive version is only made the first time it's needed"""
+    def __init__(self, image, render):
+        self.render = render # PIL image -> display image, e.g. ImageTk.PhotoImage
+        self.size = image.width * image.height * ARTWORK_BYTES_PER_PIXEL
+        self.active = render(image)
+        self._image = image
+        self._inactive = None
+
+    def get_inactive(self):
+        if self._inactive is None:
+            self._inactive = self.render(dim_art(self._image))
+            self._image = None
+        return self._inactive
+
+
+class ArtworkCache:
+    """
+    Least recently used cache of prepared Artwork, limited by memory rather than by entry count.
+    Artwork is stored under the album's collectionId and can also be found by aliases such as
+    the artist and album name reported by the client, so a revisited album shows its art before
+    any lookup has run.
+    """
+    def __init__(self, budget_mb):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.size = 0
+        self.entries = OrderedDict() # key -> (artwork, aliases)
+        self.aliases = {} # alias -> key
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            key = self.aliases.get(key, key)
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, artwork, aliases=()):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            aliases = [alias for alias in aliases if alias != key]
+            for alias in aliases:
+                # an alias moves to the newest artwork for it
+                old_key = self.aliases.get(alias)
+                if old_key is not None and old_key in self.entries:
+                    self.entries[old_key][1].remove(alias)
+                self.aliases[alias] = key
+            self.entries[key] = (artwork, aliases)
+            self.size += artwork.size
+            while self.size > self.budget and len(self.entries) > 1:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        (artwork, aliases) = self.entries.pop(key)
+        self.size -= artwork.size
+        for alias in aliases:
+            if self.aliases.get(alias) == key:
+                del self.aliases[alias]
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.aliases.get(key, key) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ArtDerivatives:
+    """
+    Pre-computed, resized copies of the downloaded album art, stored in album_images/derived/.
+    The size is part of each file name, so a new screen resolution simply generates new files the
+    first time they are needed and nothing has to resize the 1000px originals on a hot path.
+    """
+    def __init__(self, art_path, display_size=None, tile_size=None, thumbnail_size=THUMBNAIL_SIZE):
+        self.art_path = art_path
+        self.derived_path = os.path.join(art_path, DERIVED_DIR)
+        self.sizes = {
+            "display": display_size,
+            "tile": tile_size,
+            "thumb": thumbnail_size,
+        }
+        if not os.path.exists(self.derived_path):
+            os.makedirs(self.derived_path)
+
+    def original_path(self, album_id):
+        return os.path.join(self.art_path, f"{album_id}.jpg")
+
+    def path(self, album_id, kind):
+        return os.path.join(self.derived_path, f"{album_id}_{kind}_{self.sizes[kind]}.jpg")
+
+    def get(self, album_id, kind):
+        '''Path of a derivative, generated from the original if it doesn't exist yet'''
+        if not self.sizes.get(kind) or not ALBUM_ID_PATTERN.match(str(album_id)):
+            return None
+        path = self.path(album_id, kind)
+        if not os.path.exists(path):
+            self.generate(album_id, kinds=[kind])
+        return path if os.path.exists(path) else None
+
+    def generate(self, album_id, image_data=None, kinds=None):
+        '''Create any missing derivatives for an album, returns a dict of kind -> path'''
+        kinds = [kind for kind in (kinds or self.sizes) if self.sizes[kind]]
+        missing = [kind for kind in kinds if not os.path.exists(self.path(album_id, kind))]
+        if missing and image_data is None and not os.path.exists(self.original_path(album_id)):
+            return {}
+        if missing:
+            try:
+                if image_data is not None:
+                    original = Image.open(io.BytesIO(image_data))
+                else:
+                    original = Image.open(self.original_path(album_id))
+                # the largest derivative is what the decoder has to deliver
+                largest = max(self.sizes[kind] for kind in missing)
+                original.draft("RGB", (largest, largest))
+                original = original.convert("RGB")
+            except Exception as e:
+                logger.error(f"Unable to open album art for {album_id}: {e}")
+                return {}
+            resized = {}
+            for kind in missing:
+                size = self.sizes[kind]
+                if size not in resized:
+                    resized[size] = original.resize((size, size), Image.LANCZOS)
+                self._save(resized[size], self.path(album_id, kind))
+            logger.debug(f"Generated {', '.join(missing)} art for {album_id}")
+        return {kind: self.path(album_id, kind) for kind in kinds}
+
+    def _save(self, image, path):
+        data = io.BytesIO()
+        image.save(data, "JPEG", quality=90)
+        atomic_write(path, data.getvalue())
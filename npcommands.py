@@ -0,0 +1,49 @@
+import logging
+import queue
+from threading import Lock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class UICommandQueue:
+    """
+    Runs display updates on the Tk main thread. Any thread can post a command, which wakes
+    the Tk event loop with after(0) so the command runs within a few milliseconds, and Tk
+    itself is only ever touched from the thread running mainloop().
+    """
+    def __init__(self, tk):
+        self.tk = tk
+        self.commands = queue.Queue()
+        self.lock = Lock()
+        self.wake_pending = False
+
+    def post(self, func, *args):
+        '''Queue func(*args) to run on the Tk main thread'''
+        self.commands.put((func, args))
+        with self.lock:
+            if self.wake_pending:
+                return
+            self.wake_pending = True
+        try:
+            # tkinter hands calls made from other threads to the thread running mainloop()
+            self.tk.after(0, self.drain)
+        except RuntimeError as e:
+            # mainloop() hasn't started yet, the first drain picks the command up
+            logger.debug(f"Unable to wake the display: {e}")
+            with self.lock:
+                self.wake_pending = False
+
+    def drain(self):
+        '''Run every queued command, called on the Tk main thread'''
+        with self.lock:
+            self.wake_pending = False
+        while True:
+            try:
+                (func, args) = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Display command {getattr(func, '__name__', func)} failed: {e}")
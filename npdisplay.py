@@ -1,17 +1,100 @@
 import tkinter as tk
 from tkinter import Label, ttk
+from tkinter import font as tkfont
+from PIL import ImageTk
 from threading import Timer
+import logging
 import time
 from screensaver import AlbumArtScreensaver
 from nputils import display_on, check_xrandr
+from nplayout import ALBUM_LINES, ARTIST_LINES, MIN_FONT_SCALE, TITLE_LINES, FontMetrics, TextFitter
+from npprogress import PlaybackProgress
 
 try:
     from npsettings_local import screensaver_delay, primary_fontname, header_fontname
 except ImportError:
     from npsettings import screensaver_delay, primary_fontname, header_fontname
 
-
-class NowPlayingDisplay:
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class WidgetRenderer:
+    """
+    Applies widget changes in frames. The last value applied to each widget option is kept, so
+    setting an option to the value it already has costs nothing, and every real change made while
+    handling an event is applied together in one frame when Tk goes idle. Targets are widgets, or
+    ttk style names for style options.
+    """
+    def __init__(self, tk_instance):
+        self.tk = tk_instance
+        self.style = ttk.Style()
+        self.applied = {} # (target, option) -> value on screen
+        self.pending = {} # (target, option) -> value for the next frame
+        self.frame_scheduled = False
+        self.frames = 0
+        self.updates = 0 # options changed on screen
+        self.skipped = 0 # updates dropped because nothing changed
+        self.last_frame_updates = 0
+
+    def set(self, target, **options):
+        for option, value in options.items():
+            key = (target, option)
+            if value == self.pending.get(key, self.applied.get(key, _UNSET)):
+                self.skipped += 1
+                continue
+            if value == self.applied.get(key, _UNSET):
+                # changed back before the frame was drawn
+                del self.pending[key]
+                self.skipped += 1
+                continue
+            self.pending[key] = value
+        if self.pending and not self.frame_scheduled:
+            self.frame_scheduled = True
+            self.tk.after_idle(self.render)
+
+    def get(self, target, option):
+        '''The value an option has, or will have after the next frame'''
+        key = (target, option)
+        value = self.pending.get(key, self.applied.get(key, _UNSET))
+        if value is _UNSET:
+            value = self.style.lookup(target, option) if isinstance(target, str) else target.cget(option)
+        return value
+
+    def render(self):
+        '''Apply every pending change, one configure call per widget'''
+        self.frame_scheduled = False
+        if not self.pending:
+            return
+        changes = {}
+        for (target, option), value in self.pending.items():
+            changes.setdefault(target, {})[option] = value
+        self.applied.update(self.pending)
+        count = len(self.pending)
+        self.pending = {}
+        for target, options in changes.items():
+            if isinstance(target, str):
+                self.style.configure(target, **options)
+            else:
+                target.config(**options)
+        self.frames += 1
+        self.updates += count
+        self.last_frame_updates = count
+        logger.debug(f"frame {self.frames}: {count} widget updates ({self.skipped} skipped so far)")
+
+    def get_stats(self):
+        return {
+            "frames": self.frames,
+            "updates": self.updates,
+            "skipped": self.skipped,
+            "last_frame_updates": self.last_frame_updates,
+            "updates_per_frame": self.updates / self.frames if self.frames else 0,
+        }
+
+
+class NowPlayingDisplay(PlaybackProgress):
     """This class is for creating and updating the objects of the Now Playing screen."""
     def __init__(self, tk_instance, sw, sh):
         self.fontsize = sh // 33
@@ -33,6 +116,15 @@ class NowPlayingDisplay:
         self.screensaver_lock = False
         self.screensaver = None
         self.DEBUG = False
+        self.tk = tk_instance
+        self.renderer = WidgetRenderer(tk_instance)
+        self._init_progress(sw)
+        self.metrics = FontMetrics(lambda **font: tkfont.Font(root=tk_instance, **font))
+        min_fontsize = max(int(self.fontsize * MIN_FONT_SCALE), 1)
+        self.title_fitter = TextFitter(self.metrics, self.fontname, "bold", self.fontsize, min_fontsize)
+        self.text_fitter = TextFitter(self.metrics, self.fontname, "normal", self.fontsize, min_fontsize)
+        self.text_width = int((sw - sh) * 0.97) # same as the label wraplength
+        self.text_boxes = {} # label -> (width, height), measured on first use
 
         # if the system has xrandr, then enable checking for display power
         if check_xrandr():
@@ -277,76 +369,73 @@ class NowPlayingDisplay:
         self.right_pgbar["value"] = 0
 
 
-    def _time_to_seconds(self, time_str):
-        # Convert time string in mm:ss format to seconds
-        try:
-            minutes, seconds = map(int, str(time_str).split(':'))
-        except:
-            minutes, seconds = 0, 0
-        return minutes * 60 + seconds
-    
-    def _update_progress_bar(self, elapsed):
-        # Convert elapsed and duration to seconds
-        elapsed_seconds = self._time_to_seconds(elapsed)
-        duration_seconds = self._time_to_seconds(self.get_duration())
+    def _show_elapsed(self, text):
+        self.renderer.set(self.elapsed_lbl, text=text)
 
-        if duration_seconds == 0:
-            self.progress_bar["value"] = 0
-            return
-        else:
-            percentage_elapsed = (elapsed_seconds / duration_seconds) * 100
-            self.progress_bar["value"] = percentage_elapsed
+    def _show_progress(self, pixel):
+        self.renderer.set(self.progress_bar, value=pixel * 100 / self.progress_length)
 
     def get_duration(self):
-        return self.duration_lbl.cget("text")
+        return self.renderer.get(self.duration_lbl, "text")
 
     def set_duration(self, duration):
-        self.duration_lbl.config(text=duration)
+        self.renderer.set(self.duration_lbl, text=duration)
 
     def set_debug(self, debug):
         self.DEBUG = debug
+        if debug:
+            logger.setLevel(logging.DEBUG)
+
+    def get_render_stats(self):
+        return self.renderer.get_stats()
+
+    def make_image(self, image):
+        '''Turn a PIL image into something set_artwork() can show'''
+        return ImageTk.PhotoImage(image)
 
-    def set_elapsed(self, new_elapsed):
-        self.elapsed_lbl.config(text=new_elapsed)
-        # update progress bar with new elapsed time
-        self._update_progress_bar(new_elapsed)
+    def _text_box(self, label, fitter, lines, padx):
+        box = self.text_boxes.get(label)
+        if box is None:
+            line_height = self.metrics.line_height(fitter.family, fitter.max_size, fitter.weight)
+            box = self.text_boxes[label] = (self.text_width - 2 * padx, lines * line_height)
+        return box
+
+    def _set_fitted_text(self, label, fitter, text, lines, padx=0):
+        # use the largest font size (up to the normal one) and the line breaks that fit the label
+        (size, text) = fitter.fit(text, *self._text_box(label, fitter, lines, padx))
+        self.renderer.set(label, text=text, font=(fitter.family, size, fitter.weight))
 
     def set_title(self, new_title):
-        self.title_lbl.config(text=new_title)
+        self._set_fitted_text(self.title_lbl, self.title_fitter, new_title, TITLE_LINES)
 
     def set_artist(self, new_artist):
-        self.artist_lbl.config(text=new_artist)
+        self._set_fitted_text(self.artist_lbl, self.text_fitter, new_artist, ARTIST_LINES, padx=10)
 
     def set_album(self, new_album):
-        self.album_lbl.config(text=new_album)
+        self._set_fitted_text(self.album_lbl, self.text_fitter, new_album, ALBUM_LINES, padx=10)
 
     def set_album_released(self, new_album_released):
-        self.album_released_lbl.config(text=new_album_released)
+        self.renderer.set(self.album_released_lbl, text=new_album_released)
     
     def set_album_duration(self, new_album_duration):
-        self.album_duration_lbl.config(text=new_album_duration)
+        self.renderer.set(self.album_duration_lbl, text=new_album_duration)
 
     def set_artwork(self, active_artwork, inactive_artwork):
+        # inactive_artwork can be a function that makes it, so it's only built if the player goes inactive
         self.active_artwork = active_artwork
         self.inactive_artwork = inactive_artwork
-        self.art_lbl.config(image=active_artwork)
+        self.renderer.set(self.art_lbl, image=active_artwork)
 
     def set_track(self, track_text):
-        self.track_lbl.config(text=track_text)
+        self.renderer.set(self.track_lbl, text=track_text)
 
     def _update_foreground(self):
-        # Update the text color of the labels
-        self.album_lbl.config(fg=self.foreground)
-        self.album_released_lbl.config(fg=self.foreground)
-        self.album_duration_lbl.config(fg=self.foreground)
-        self.artist_lbl.config(fg=self.foreground)
-        self.title_lbl.config(fg=self.foreground)
-        self.track_lbl.config(fg=self.foreground)
-        self.elapsed_lbl.config(fg=self.foreground)
-        self.duration_lbl.config(fg=self.foreground)
+        # Update the text color of the labels, only the ones that actually change get redrawn
+        for label in (self.album_lbl, self.album_released_lbl, self.album_duration_lbl, self.artist_lbl,
+                      self.title_lbl, self.track_lbl, self.elapsed_lbl, self.duration_lbl):
+            self.renderer.set(label, fg=self.foreground)
         # Update the progress bar style's background color
-        style = ttk.Style()
-        style.configure("Custom.Horizontal.TProgressbar", background=self.pgbar_color)
+        self.renderer.set("Custom.Horizontal.TProgressbar", background=self.pgbar_color)
 
     def start_screensaver(self, delay):
         if AlbumArtScreensaver.running:
@@ -373,8 +462,10 @@ class NowPlayingDisplay:
             self.foreground = self.inactive_foreground
             self.pgbar_color = self.inactive_pgbar_color
             # use the inactive artwork if it is available
+            if callable(self.inactive_artwork):
+                self.inactive_artwork = self.inactive_artwork()
             if self.inactive_artwork:
-                self.art_lbl.config(image=self.inactive_artwork)
+                self.renderer.set(self.art_lbl, image=self.inactive_artwork)
             self._update_foreground()
             self.start_screensaver(screensaver_delay)
 
@@ -384,7 +475,7 @@ class NowPlayingDisplay:
         self.pgbar_color = self.active_pgbar_color
         # use the active artwork if it is available
         if self.active_artwork:
-            self.art_lbl.config(image=self.active_artwork)
+            self.renderer.set(self.art_lbl, image=self.active_artwork)
         self._update_foreground()
         if self.screensaver_timer:
             self._stop_screensaver()
@@ -0,0 +1,479 @@
+import fcntl
+import heapq
+import itertools
+import logging
+import os
+import io
+import struct
+import time
+from threading import Condition
+
+from PIL import Image, ImageChops, ImageDraw
+
+from get_cover_art.art_store import atomic_write
+
+from nplayout import ALBUM_LINES, ARTIST_LINES, MIN_FONT_SCALE, TITLE_LINES, FontMetrics, PillowFont, TextFitter
+from npprogress import PlaybackProgress
+
+try:
+    from npsettings_local import framebuffer_font, framebuffer_bold_font
+except ImportError:
+    from npsettings import framebuffer_font, framebuffer_bold_font
+
+# npframebuffer.py draws the now playing screen with Pillow alone, no X server, Tk or pygame.
+# Frames go to a Linux framebuffer (/dev/fb0) or to PNG files, and only the regions that
+# changed are redrawn and written. Run now_playing.py with --headless to use it.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = (800, 480)
+FBIOGET_VSCREENINFO = 0x4600
+VSCREENINFO_SIZE = 160 # bytes in struct fb_var_screeninfo
+BORDER_WIDTH = 6 # px, the bars on both sides of the text
+
+
+class FrameLoop:
+    """
+    A small event loop with the parts of the Tk API the display code uses: after, after_idle,
+    after_cancel, mainloop and quit. Callbacks can be scheduled from any thread.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.timers = [] # heap of (due, id, func, args)
+        self.idle = [] # (id, func, args)
+        self.cancelled = set()
+        self.ids = itertools.count(1)
+        self.condition = Condition()
+        self.running = False
+
+    def winfo_screenwidth(self):
+        return self.width
+
+    def winfo_screenheight(self):
+        return self.height
+
+    def after(self, ms, func, *args):
+        timer_id = next(self.ids)
+        with self.condition:
+            heapq.heappush(self.timers, (time.monotonic() + ms / 1000, timer_id, func, args))
+            self.condition.notify()
+        return timer_id
+
+    def after_idle(self, func, *args):
+        timer_id = next(self.ids)
+        with self.condition:
+            self.idle.append((timer_id, func, args))
+            self.condition.notify()
+        return timer_id
+
+    def after_cancel(self, timer_id):
+        with self.condition:
+            self.cancelled.add(timer_id)
+
+    def quit(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def mainloop(self):
+        self.running = True
+        while True:
+            with self.condition:
+                while self.running and not self.idle and not self._due():
+                    timeout = self.timers[0][0] - time.monotonic() if self.timers else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                due = []
+                while self._due():
+                    due.append(heapq.heappop(self.timers))
+            # timers first, then the idle callbacks they scheduled, like Tk
+            for (_due, timer_id, func, args) in due:
+                self._run(timer_id, func, args)
+            with self.condition:
+                (idle, self.idle) = (self.idle, [])
+            for (timer_id, func, args) in idle:
+                self._run(timer_id, func, args)
+
+    def _due(self):
+        return self.timers and self.timers[0][0] <= time.monotonic()
+
+    def _run(self, timer_id, func, args):
+        with self.condition:
+            if timer_id in self.cancelled:
+                self.cancelled.discard(timer_id)
+                return
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Callback {getattr(func, '__name__', func)} failed: {e}")
+
+
+class PngOutput:
+    """Writes every frame to a PNG file, a {frame} in the path numbers the files"""
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+
+    def size(self):
+        return None
+
+    def write(self, frame, boxes):
+        data = io.BytesIO()
+        frame.save(data, "PNG")
+        atomic_write(self.path.format(frame=self.frames), data.getvalue())
+        self.frames += 1
+
+
+class FramebufferOutput:
+    """Writes the changed regions of each frame straight into a Linux framebuffer device"""
+    def __init__(self, device="/dev/fb0"):
+        sysfs = os.path.join("/sys/class/graphics", os.path.basename(device))
+        self.bits_per_pixel = int(self._read(sysfs, "bits_per_pixel"))
+        self.stride = int(self._read(sysfs, "stride"))
+        if self.bits_per_pixel not in (16, 24, 32):
+            raise ValueError(f"{device} uses {self.bits_per_pixel} bits per pixel, only 16, 24 and 32 are supported")
+        self.bytes_per_pixel = self.bits_per_pixel // 8
+        self.device = open(device, "r+b", buffering=0)
+        # the virtual size can be larger than the screen (double buffering, panning),
+        # so draw at the visible resolution, on the part of the buffer that is showing
+        (self.width, self.height, self.x_offset, self.y_offset) = self._visible_area(sysfs)
+
+    def _read(self, sysfs, name):
+        with open(os.path.join(sysfs, name)) as file:
+            return file.read().strip()
+
+    def _visible_area(self, sysfs):
+        '''(width, height, x offset, y offset) of the visible screen in the framebuffer'''
+        try:
+            info = fcntl.ioctl(self.device.fileno(), FBIOGET_VSCREENINFO, bytes(VSCREENINFO_SIZE))
+            (xres, yres, _xres_virtual, _yres_virtual, xoffset, yoffset) = struct.unpack_from("6I", info)
+            return xres, yres, xoffset, yoffset
+        except OSError as e:
+            logger.debug(f"FBIOGET_VSCREENINFO failed, using the current mode from sysfs: {e}")
+        # e.g. U:800x480p-60, the first mode listed is the one in use
+        mode = self._read(sysfs, "modes").splitlines()[0]
+        (width, height) = mode.split(":")[-1].split("p")[0].split("i")[0].split("x")
+        return int(width), int(height), 0, 0
+
+    def size(self):
+        return self.width, self.height
+
+    def _pixels(self, region):
+        if self.bits_per_pixel == 32:
+            return region.tobytes("raw", "BGRX")
+        if self.bits_per_pixel == 24:
+            return region.tobytes("raw", "BGR")
+        # RGB565, little endian: rrrrrggg gggbbbbb
+        (red, green, blue) = region.split()
+        high = ImageChops.add(red.point(lambda value: value & 0xF8), green.point(lambda value: value >> 5))
+        low = ImageChops.add(green.point(lambda value: (value & 0x1C) << 3), blue.point(lambda value: value >> 3))
+        return Image.merge("LA", (low, high)).tobytes()
+
+    def write(self, frame, boxes):
+        for (x0, y0, x1, y1) in boxes:
+            data = self._pixels(frame.crop((x0, y0, x1, y1)))
+            row_bytes = (x1 - x0) * self.bytes_per_pixel
+            for row in range(y1 - y0):
+                self.device.seek((self.y_offset + y0 + row) * self.stride + (self.x_offset + x0) * self.bytes_per_pixel)
+                self.device.write(data[row * row_bytes:(row + 1) * row_bytes])
+
+    def close(self):
+        self.device.close()
+
+
+class PillowDisplay(PlaybackProgress):
+    """
+    The now playing screen composed with Pillow: art on the left, header bars with the title,
+    album, artists and track on the right, then the elapsed time and the progress bar. It has
+    the same methods as NowPlayingDisplay. Every part of the screen is a region, a change only
+    marks its region, and the regions that changed are redrawn and written out together when
+    the loop goes idle.
+    """
+    def __init__(self, loop, sw, sh, output):
+        self.tk = loop
+        self.output = output
+        self.sw = sw
+        self.sh = sh
+        self.fontsize = sh // 33
+        self.header_fontsize = int(self.fontsize * 0.8)
+        self.bgcolor = "#000000"
+        self.header_bgcolor = "#1F1F1F"
+        self.header_fgcolor = "#CCCCCC"
+        self.active_foreground = "#FFFFFF"
+        self.inactive_foreground = "#666666"
+        self.active_pgbar_color = "#7D7D7D"
+        self.inactive_pgbar_color = "#5C5C5C"
+        self.foreground = self.active_foreground
+        self.pgbar_color = self.active_pgbar_color
+        self.active_artwork = None
+        self.inactive_artwork = None
+        self.inactive = False
+        self.display_check = False
+        self.DEBUG = False
+        self.metrics = FontMetrics(PillowFont)
+        min_fontsize = max(int(self.fontsize * MIN_FONT_SCALE), 1)
+        self.title_fitter = TextFitter(self.metrics, framebuffer_bold_font, "bold", self.fontsize, min_fontsize)
+        self.text_fitter = TextFitter(self.metrics, framebuffer_font, "normal", self.fontsize, min_fontsize)
+        self.values = {
+            "title": "", "album": "", "artist": "", "track": "",
+            "released": "", "album_duration": "", "elapsed": "0:00", "duration": "0:00",
+        }
+        self.frame = Image.new("RGB", (sw, sh), self.bgcolor)
+        self.draw = ImageDraw.Draw(self.frame)
+        self.dirty = set()
+        self.frame_scheduled = False
+        self.frames = 0
+        self.regions_drawn = 0
+        self.pixels_drawn = 0
+        self.last_frame_regions = 0
+        self._layout()
+        self._init_progress(self.boxes["progress"][2] - self.boxes["progress"][0])
+        self.progress_pixel = 0
+        # the first frame draws everything, headers included
+        self._draw_static()
+        self._mark(*self.boxes)
+
+    def _layout(self):
+        (sw, sh) = (self.sw, self.sh)
+        x0 = sh
+        header_height = self.metrics.line_height(framebuffer_font, self.header_fontsize) + 4
+        line_height = self.metrics.line_height(framebuffer_font, self.fontsize)
+        bar_height = max(sh // 100, 4)
+        time_height = line_height + 4
+        text_width = int((sw - sh) * 0.97)
+        self.text_boxes = {
+            "title": (text_width, TITLE_LINES * self.metrics.line_height(framebuffer_bold_font, self.fontsize)),
+            "album": (text_width - 20, ALBUM_LINES * line_height),
+            "artist": (text_width - 20, ARTIST_LINES * line_height),
+            "track": (text_width - 20, line_height),
+        }
+        # the sections share the height like the Tk grid rows, with weights 3, 3, 3 and 2
+        sections = (("title", 3), ("album", 3), ("artist", 3), ("track", 2))
+        available = sh - time_height - bar_height
+        total_weight = sum(weight for (_name, weight) in sections)
+        self.headers = {}
+        self.boxes = {"art": (0, 0, sh, sh)}
+        y = 0
+        for (index, (name, weight)) in enumerate(sections):
+            height = available * weight // total_weight if index < len(sections) - 1 else available - y
+            self.headers[name] = (x0, y, sw, y + header_height)
+            self.boxes[name] = (x0, y + header_height, sw - BORDER_WIDTH, y + height)
+            if name == "album":
+                # the release date and album length sit along the bottom of the album section
+                footer_height = self.metrics.line_height(framebuffer_font, self.header_fontsize) + 2
+                self.boxes["album"] = (x0, y + header_height, sw - BORDER_WIDTH, y + height - footer_height)
+                self.boxes["album_footer"] = (x0, y + height - footer_height, sw - BORDER_WIDTH, y + height)
+            y += height
+        self.boxes["time"] = (x0, y, sw - BORDER_WIDTH, y + time_height)
+        self.boxes["progress"] = (x0, sh - bar_height, sw, sh)
+
+    def _draw_static(self):
+        header_font = self._font(framebuffer_font, self.header_fontsize)
+        labels = {"title": "title", "album": "album", "artist": "artists", "track": "track"}
+        for (name, box) in self.headers.items():
+            self.draw.rectangle(self._inclusive(box), fill=self.header_bgcolor)
+            self.draw.text(((box[0] + box[2]) // 2, box[1] + 2), labels[name], font=header_font,
+                           fill=self.header_fgcolor, anchor="ma")
+        # the borders on both sides of the text
+        self.draw.rectangle((self.sh - BORDER_WIDTH, 0, self.sh - 1, self.sh - 1), fill=self.header_bgcolor)
+        self.draw.rectangle((self.sw - BORDER_WIDTH, 0, self.sw - 1, self.sh - 1), fill=self.header_bgcolor)
+
+    def _font(self, family, size, weight="normal"):
+        return self.metrics.get_font(family, size, weight).font
+
+    def _inclusive(self, box):
+        return (box[0], box[1], box[2] - 1, box[3] - 1)
+
+    def _mark(self, *regions):
+        self.dirty.update(regions)
+        if self.dirty and not self.frame_scheduled:
+            self.frame_scheduled = True
+            self.tk.after_idle(self.render)
+
+    def _set(self, name, value, region=None):
+        if self.values.get(name) == value:
+            return
+        self.values[name] = value
+        self._mark(region or name)
+
+    def render(self):
+        '''Redraw the regions that changed and write them out'''
+        self.frame_scheduled = False
+        if not self.dirty:
+            return
+        boxes = []
+        for region in self.dirty:
+            getattr(self, f"_draw_{region}", self._draw_text)(region)
+            boxes.append(self.boxes[region])
+        if "art" in self.dirty:
+            # the art is drawn under the border
+            self.draw.rectangle((self.sh - BORDER_WIDTH, 0, self.sh - 1, self.sh - 1), fill=self.header_bgcolor)
+        if len(self.dirty) == len(self.boxes):
+            boxes = [(0, 0, self.sw, self.sh)]
+        self.dirty = set()
+        self.output.write(self.frame, boxes)
+        self.frames += 1
+        self.regions_drawn += len(boxes)
+        self.pixels_drawn += sum((x1 - x0) * (y1 - y0) for (x0, y0, x1, y1) in boxes)
+        self.last_frame_regions = len(boxes)
+        logger.debug(f"frame {self.frames}: {len(boxes)} regions")
+
+    def _clear(self, region):
+        self.draw.rectangle(self._inclusive(self.boxes[region]), fill=self.bgcolor)
+
+    def _draw_text(self, region):
+        self._clear(region)
+        fitter = self.title_fitter if region == "title" else self.text_fitter
+        (size, text) = fitter.fit(self.values[region], *self.text_boxes[region])
+        if not text:
+            return
+        font = self._font(fitter.family, size, fitter.weight)
+        (x0, y0, x1, y1) = self.boxes[region]
+        # centered in the box, like the Tk labels
+        (_left, top, _right, bottom) = self.draw.multiline_textbbox((0, 0), text, font=font, align="center")
+        y = y0 + max((y1 - y0 - (bottom - top)) // 2 - top, 0)
+        self.draw.multiline_text(((x0 + x1) // 2, y), text, font=font, fill=self.foreground, anchor="ma", align="center")
+
+    def _draw_album_footer(self, region):
+        self._clear(region)
+        font = self._font(framebuffer_font, self.header_fontsize)
+        (x0, y0, x1, y1) = self.boxes[region]
+        self.draw.text((x0 + 5, y1 - 1), self.values["released"], font=font, fill=self.foreground, anchor="ld")
+        self.draw.text((x1 - 20, y1 - 1), self.values["album_duration"], font=font, fill=self.foreground, anchor="rd")
+
+    def _draw_time(self, region):
+        self._clear(region)
+        font = self._font(framebuffer_font, self.fontsize)
+        (x0, y0, x1, y1) = self.boxes[region]
+        self.draw.text((x0 + 5, y1 - 1), self.values["elapsed"], font=font, fill=self.foreground, anchor="ld")
+        self.draw.text((x1 - 20, y1 - 1), self.values["duration"], font=font, fill=self.foreground, anchor="rd")
+
+    def _draw_progress(self, region):
+        (x0, y0, x1, y1) = self.boxes[region]
+        self.draw.rectangle((x0, y0, x1 - 1, y1 - 1), fill=self.header_bgcolor)
+        if self.progress_pixel > 0:
+            self.draw.rectangle((x0, y0, x0 + self.progress_pixel - 1, y1 - 1), fill=self.pgbar_color)
+
+    def _draw_art(self, region):
+        artwork = self.inactive_artwork if self.inactive and self.inactive_artwork else self.active_artwork
+        if artwork is None:
+            self._clear(region)
+            return
+        (x0, y0, x1, y1) = self.boxes[region]
+        if artwork.size != (x1 - x0, y1 - y0):
+            artwork = artwork.resize((x1 - x0, y1 - y0))
+        self.frame.paste(artwork, (x0, y0))
+
+    def _show_elapsed(self, text):
+        self._set("elapsed", text, "time")
+
+    def _show_progress(self, pixel):
+        self._mark("progress")
+
+    def make_image(self, image):
+        '''Artwork is shown as the PIL image itself'''
+        return image
+
+    def get_duration(self):
+        return self.values["duration"]
+
+    def set_duration(self, duration):
+        self._set("duration", duration, "time")
+
+    def set_debug(self, debug):
+        self.DEBUG = debug
+        if debug:
+            logger.setLevel(logging.DEBUG)
+
+    def get_render_stats(self):
+        return {
+            "frames": self.frames,
+            "regions": self.regions_drawn,
+            "pixels": self.pixels_drawn,
+            "last_frame_regions": self.last_frame_regions,
+        }
+
+    def set_title(self, new_title):
+        self._set("title", new_title)
+
+    def set_artist(self, new_artist):
+        self._set("artist", new_artist)
+
+    def set_album(self, new_album):
+        self._set("album", new_album)
+
+    def set_album_released(self, new_album_released):
+        self._set("released", new_album_released, "album_footer")
+
+    def set_album_duration(self, new_album_duration):
+        self._set("album_duration", new_album_duration, "album_footer")
+
+    def set_track(self, track_text):
+        self._set("track", track_text)
+
+    def set_artwork(self, active_artwork, inactive_artwork):
+        # inactive_artwork can be a function that makes it, so it's only built if the player goes inactive
+        self.active_artwork = active_artwork
+        self.inactive_artwork = inactive_artwork
+        if self.inactive:
+            self._resolve_inactive()
+        self._mark("art")
+
+    def _resolve_inactive(self):
+        if callable(self.inactive_artwork):
+            self.inactive_artwork = self.inactive_artwork()
+
+    def _set_colors(self, foreground, pgbar_color):
+        if (foreground, pgbar_color) == (self.foreground, self.pgbar_color):
+            return
+        self.foreground = foreground
+        self.pgbar_color = pgbar_color
+        self._mark("title", "album", "artist", "track", "album_footer", "time", "progress")
+
+    def set_inactive(self):
+        # dim the text color when the player is inactive, there's no screensaver without a window system
+        if not self.inactive:
+            self.inactive = True
+            self._resolve_inactive()
+            self._mark("art")
+        self._set_colors(self.inactive_foreground, self.inactive_pgbar_color)
+
+    def set_active(self):
+        if self.inactive:
+            self.inactive = False
+            self._mark("art")
+        self._set_colors(self.active_foreground, self.active_pgbar_color)
+
+    def start_screensaver(self, delay):
+        logger.debug("The screensaver needs a window system, not available on the headless display")
+
+
+def create_display(target, size=None):
+    '''The event loop, display and output for a --headless target, a framebuffer device or a PNG path'''
+    if target.startswith("/dev/"):
+        output = FramebufferOutput(target)
+    else:
+        output = PngOutput(target)
+    (width, height) = output.size() or size or DEFAULT_SIZE
+    loop = FrameLoop(width, height)
+    return loop, PillowDisplay(loop, width, height, output)
+
+
+if __name__ == "__main__":
+    # render a sample screen, e.g. python3 npframebuffer.py sample.png
+    import sys
+    (loop, display) = create_display(sys.argv[1] if len(sys.argv) > 1 else "npframebuffer_sample.png")
+    display.set_title("Symphony No. 9 in D Minor, Op. 125 \"Choral\": IV. Presto (Live)")
+    display.set_album("Beethoven: Symphony No. 9")
+    display.set_artist("Leonard Bernstein\nNew York Philharmonic")
+    display.set_track("4 of 4")
+    display.set_album_released("September 1, 1964")
+    display.set_album_duration("1 hour, 5 minutes")
+    display.set_duration("24:47")
+    display.set_elapsed("12:03")
+    display.set_artwork(Image.new("RGB", (display.sh, display.sh), "#35506B"), None)
+    display.render()
+    print(display.get_render_stats())
@@ -0,0 +1,161 @@
+import logging
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# places a title is broken first, the text before them stays on its own line
+PREFERRED_BREAKS = (" (", ": ")
+MIN_FONT_SCALE = 0.6 # long text can shrink to 60% of the normal font size before it has to overflow
+# how many lines of the normal font size each text fits in
+TITLE_LINES = 3
+ALBUM_LINES = 2
+ARTIST_LINES = 4
+
+
+class FontMetrics:
+    """
+    Cached text measurement. Measuring through Tk is slow, so every glyph is measured once per
+    font and size and string widths are added up from the glyph widths (and kept in a small
+    LRU). font_factory(family, size, weight) returns an object with measure(text) and
+    metrics("linespace"), such as tkinter.font.Font.
+    """
+    def __init__(self, font_factory, string_cache_size=4096):
+        self.font_factory = font_factory
+        self.fonts = {} # (family, size, weight) -> (font, glyph widths, line height)
+        self.strings = OrderedDict() # (family, size, weight, text) -> width
+        self.string_cache_size = string_cache_size
+        self.measure_calls = 0
+
+    def _font(self, family, size, weight):
+        key = (family, size, weight)
+        entry = self.fonts.get(key)
+        if entry is None:
+            font = self.font_factory(family=family, size=size, weight=weight)
+            entry = self.fonts[key] = (font, {}, font.metrics("linespace"))
+        return entry
+
+    def get_font(self, family, size, weight="normal"):
+        '''The font object made by font_factory, e.g. to draw with it'''
+        return self._font(family, size, weight)[0]
+
+    def line_height(self, family, size, weight="normal"):
+        return self._font(family, size, weight)[2]
+
+    def width(self, text, family, size, weight="normal"):
+        key = (family, size, weight, text)
+        width = self.strings.get(key)
+        if width is not None:
+            self.strings.move_to_end(key)
+            return width
+        (font, glyphs, _line_height) = self._font(family, size, weight)
+        width = 0
+        for glyph in text:
+            glyph_width = glyphs.get(glyph)
+            if glyph_width is None:
+                glyph_width = glyphs[glyph] = font.measure(glyph)
+                self.measure_calls += 1
+            width += glyph_width
+        self.strings[key] = width
+        if len(self.strings) > self.string_cache_size:
+            self.strings.popitem(last=False)
+        return width
+
+
+class PillowFont:
+    """Measures text with Pillow in place of tkinter.font.Font, for layout without a display"""
+    def __init__(self, family, size, weight="normal"):
+        from PIL import ImageFont
+        try:
+            self.font = ImageFont.truetype(family, size)
+        except OSError:
+            # the family isn't a font file Pillow can find, measure with its built in font
+            self.font = ImageFont.load_default(size)
+        (ascent, descent) = self.font.getmetrics()
+        self.linespace = ascent + descent
+
+    def measure(self, text):
+        return int(self.font.getlength(text))
+
+    def metrics(self, option):
+        if option != "linespace":
+            raise ValueError(f"unsupported font metric: {option}")
+        return self.linespace
+
+
+class TextFitter:
+    """
+    Picks the largest font size, and the line breaks, that fit a text into a box. Text is broken
+    at existing newlines, then at the preferred breaks of a title, then between words, and a
+    word that is too long for a line on its own is broken between characters.
+    """
+    def __init__(self, metrics, family, weight="normal", max_size=20, min_size=8):
+        self.metrics = metrics
+        self.family = family
+        self.weight = weight
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+
+    def fit(self, text, width, height):
+        '''Returns (font size, text with line breaks), the smallest size is used if nothing fits'''
+        if not text:
+            return self.max_size, text
+        # fitting gets easier as the size goes down, so binary search for the largest size that fits
+        (low, high) = (self.min_size, self.max_size)
+        best = None
+        while low <= high:
+            size = (low + high) // 2
+            lines = self.wrap(text, width, size)
+            if len(lines) * self.metrics.line_height(self.family, size, self.weight) <= height:
+                best = (size, lines)
+                low = size + 1
+            else:
+                high = size - 1
+        if best is None:
+            best = (self.min_size, self.wrap(text, width, self.min_size))
+        return best[0], "\n".join(best[1])
+
+    def wrap(self, text, width, size):
+        lines = []
+        for paragraph in text.split("\n"):
+            for part in self._split_preferred(paragraph, width, size):
+                lines.extend(self._wrap_words(part, width, size))
+        return lines
+
+    def _fits(self, text, width, size):
+        return self.metrics.width(text, self.family, size, self.weight) <= width
+
+    def _split_preferred(self, text, width, size):
+        # a line that is too long is split at its first preferred break, e.g. before a "(feat. ...)"
+        if self._fits(text, width, size):
+            return [text]
+        for separator in PREFERRED_BREAKS:
+            index = text.find(separator)
+            if index > 0:
+                if separator == " (":
+                    (head, tail) = (text[:index], text[index + 1:])
+                else:
+                    (head, tail) = (text[:index + len(separator)].rstrip(), text[index + len(separator):])
+                return [head] + self._split_preferred(tail, width, size)
+        return [text]
+
+    def _wrap_words(self, text, width, size):
+        lines = []
+        line = ""
+        for word in text.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if self._fits(candidate, width, size):
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            # a single word wider than the box is broken between characters
+            while not self._fits(word, width, size) and len(word) > 1:
+                cut = len(word) - 1
+                while cut > 1 and not self._fits(word[:cut], width, size):
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+            line = word
+        lines.append(line)
+        return lines
@@ -1,37 +1,107 @@
 import musicbrainzngs
+import json
 import logging
-from datetime import datetime
 import os
+import sqlite3
+import time
+from datetime import datetime
+from threading import Lock
+
+from get_cover_art.art_store import atomic_write, is_valid_jpeg
+from get_cover_art.rate_limiter import RateLimiter, Throttled
+from npalbumdata import format_album_duration
 
 logging.basicConfig(level=logging.INFO)
 logger=logging.getLogger(__name__)
 
+MB_HOST = "musicbrainz.org"
+CAA_HOST = "coverartarchive.org"
+CAA_SIZE = "1200" # px, the Cover Art Archive's original uploads can be several MB
+
+
+class MusicBrainzCache:
+    """
+    Persistent cache of MusicBrainz lookups. Searches are keyed by the track that was looked up
+    and point at the recording and release MBIDs, releases are keyed by their MBID. Searches that
+    found nothing are cached for a shorter time.
+    """
+    def __init__(self, db_path, ttl=30 * 24 * 3600, negative_ttl=24 * 3600):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.create_tables()
+
+    def create_tables(self):
+        with self.lock:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS mb_recordings (
+                                    query TEXT PRIMARY KEY,
+                                    recording_id TEXT,
+                                    release_id TEXT,
+                                    created REAL
+                                )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS mb_releases (
+                                    release_id TEXT PRIMARY KEY,
+                                    release TEXT,
+                                    created REAL
+                                )''')
+            self.conn.commit()
+
+    def get_recording(self, query):
+        '''Returns (recording_id, release_id), empty ids for a cached miss, or None if not cached'''
+        with self.lock:
+            row = self.conn.execute('''SELECT recording_id, release_id, created FROM mb_recordings WHERE query = ?''',
+                                    (query,)).fetchone()
+        if row is None:
+            return None
+        ttl = self.ttl if row[1] else self.negative_ttl
+        if time.time() - row[2] > ttl:
+            return None
+        return row[0], row[1]
+
+    def put_recording(self, query, recording_id, release_id):
+        with self.lock:
+            self.conn.execute('''INSERT OR REPLACE INTO mb_recordings (query, recording_id, release_id, created)
+                                 VALUES (?, ?, ?, ?)''', (query, recording_id, release_id, time.time()))
+            self.conn.commit()
+
+    def get_release(self, release_id):
+        with self.lock:
+            row = self.conn.execute('''SELECT release, created FROM mb_releases WHERE release_id = ?''',
+                                    (release_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put_release(self, release_id, release):
+        with self.lock:
+            self.conn.execute('''INSERT OR REPLACE INTO mb_releases (release_id, release, created) VALUES (?, ?, ?)''',
+                              (release_id, json.dumps(release), time.time()))
+            self.conn.commit()
+
+    def close_connection(self):
+        self.conn.close()
+
+
 class MusicBrainzSearch:
-    def __init__(self, artists, album, title, duration, debug=False):
+    """
+    Album data and art provider backed by MusicBrainz and the Cover Art Archive, used when
+    Apple Music has no match. search() finds the release for a track and returns its album
+    data, the front cover is only downloaded when get_front_cover() asks for it.
+    MusicBrainz allows 1 request per second, so every search shares one rate limiter.
+    """
+    def __init__(self, debug=False, cache_path=None, art_path=None, limiter=None, max_wait=10, store=None):
         self.debug = debug
         if self.debug:
             logger.setLevel(logging.DEBUG)
-        self.search_artists = artists
-        self.search_album = album
-        self.search_title = title
-        self.search_duration = duration
-        self.album = ""
-        self.artists = ""
-        self.title = ""
-        self.album_duration = 0
-        self.tracks = []
-        self.release_id = ""
-        self.release_date = None
-        self.recording_data = {}
-        self.release_data = {}
-        self.front_cover = None
-        self.back_cover = None
-        self.art_path = ""
-        self.succeeded = False
+        self.cache = MusicBrainzCache(cache_path) if cache_path else None
+        self.limiter = limiter or RateLimiter(rate=1, burst=1, backoff=2, max_backoff=60)
+        self.max_wait = max_wait
+        self.store = store # ArtStore, so covers are indexed with the rest of the downloaded art
+        self.art_path = art_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'album_images/')
+        if not os.path.exists(self.art_path):
+            os.makedirs(self.art_path)
         self._setup()
-        if self._search_recordings():
-            self._get_release_by_id()
-            self.succeeded = True
 
     def _setup(self):
         musicbrainzngs.set_useragent(
@@ -39,138 +109,146 @@ class MusicBrainzSearch:
             "0.1.1",
             "https://github.com/anotherhobby/NowPlayingDisplay",
         )
-        self.art_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'album_images/')
-        if not os.path.exists(self.art_path):
-            os.makedirs(self.art_path)
+        # requests are spaced out by self.limiter, which can give up instead of queueing forever
+        musicbrainzngs.set_rate_limit(False)
 
     def _time_to_ms(self, time_str):
-        # Convert time string in mm:ss format to seconds
-        minutes, seconds = map(int, str(time_str).split(':'))
+        # Convert time string in mm:ss format to milliseconds
+        try:
+            minutes, seconds = map(int, str(time_str).split(':'))
+        except ValueError:
+            return None
         total_seconds = minutes * 60 + seconds
         return total_seconds * 1000
-    
-    def _ms_to_time(self, ms):
-        # Convert milliseconds to "mm:ss" format
-        seconds = ms // 1000
-        minutes = seconds // 60
-        seconds = seconds % 60
-        return f"{minutes:02}:{seconds:02}"
-    
-    def _set_album_duration(self, seconds):
-        # Convert seconds to "hh hours, mm minutes" (and ignore seconds)
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        if hours == 0:
-            self.album_duration = f"{minutes} minutes"
+
+    def _release_date(self, date):
+        # release dates can be "YYYY-MM-DD", "YYYY-MM" or "YYYY", want "Month D, YYYY" like Apple Music
+        for date_format in ("%Y-%m-%d", "%Y-%m"):
+            try:
+                release_date = datetime.strptime(date, date_format)
+            except ValueError:
+                continue
+            if date_format == "%Y-%m":
+                return f"{release_date:%B} {release_date.year}"
+            return f"{release_date:%B} {release_date.day}, {release_date.year}"
+        return date
+
+    def _request(self, host, func, *args, **kwargs):
+        '''Make a rate limited MusicBrainz request, raises Throttled if the wait would be too long'''
+        self.limiter.acquire(host, self.max_wait)
+        try:
+            result = func(*args, **kwargs)
+        except musicbrainzngs.ResponseError as e:
+            if getattr(e.cause, "code", None) in (429, 503):
+                delay = self.limiter.throttled(host, e.cause.headers.get("Retry-After"))
+                raise Throttled(host, delay)
+            raise
+        self.limiter.succeeded(host)
+        return result
+
+    def search(self, artists, album, title, duration="", stop=None):
+        '''
+        Find the album for a track, returns a dict with release_id, album, artists, title, tracks,
+        released, duration and front (whether there is a front cover), or None if nothing matched.
+        The search gives up before each request once the stop event is set.
+        '''
+        if not isinstance(artists, str):
+            artists = " ".join(artists)
+        query = "\n".join(item.strip().lower() for item in (artists, album, title))
+        cached = self.cache.get_recording(query) if self.cache else None
+        if cached is None:
+            if stop is not None and stop.is_set():
+                return None
+            (recording_id, release_id) = self._search_recordings(artists, album, title, duration)
+            if self.cache:
+                self.cache.put_recording(query, recording_id, release_id)
         else:
-            self.album_duration = f"{hours} hours, {minutes} minutes"
-
-    def _search_recordings(self):
-        logger.debug(f"Searching MusicBrainz for {self.search_title} ({self.search_duration}) by {self.search_artists} on {self.search_album}...")
-        result = musicbrainzngs.search_recordings(
-            artist=self.search_artists,
-            release=self.search_album,
-            recording=self.search_title,
-            dur=self._time_to_ms(self.search_duration),
-            format="Digital Media",
-            limit=1
-        )
-        logger.debug(f"Search result: {result}")
+            logger.debug(f"MusicBrainz search cache hit for {title} by {artists}")
+            (recording_id, release_id) = cached
+        if not release_id:
+            return None
+        if stop is not None and stop.is_set():
+            return None
+        release = self.get_release(release_id)
+        if release is None:
+            return None
+        release["title"] = next((track["title"] for track in release.pop("recordings", [])
+                                 if track["id"] == recording_id), title)
+        return release
+
+    def _search_recordings(self, artists, album, title, duration):
+        logger.debug(f"Searching MusicBrainz for {title} ({duration}) by {artists} on {album}...")
+        search = {"artist": artists, "release": album, "recording": title, "format": "Digital Media", "limit": 1}
+        duration_ms = self._time_to_ms(duration)
+        if duration_ms:
+            search["dur"] = duration_ms
+        result = self._request(MB_HOST, musicbrainzngs.search_recordings, **search)
         if len(result['recording-list']) == 0:
-            logger.error(f"Could not find recording for {self.search_title} by {self.search_artists} on {self.search_album}")
-            return False
-        else:
-            self.recording_data = result['recording-list'][0]
-            self.title = self.recording_data['title']
-            for release in self.recording_data['release-list']:
-                if release['status'] == 'Official':
-                    self.release_id = release['id']
-                    return True
-            logger.error(f"Could not find official release for {self.search_title} by {self.search_artists} on {self.search_album}")
-            return False
-        
-    def _get_release_by_id(self):
-        result = musicbrainzngs.get_release_by_id(
-            self.release_id,
-            includes=["artists", "recordings", "media"]
-        )
-        self.release_data = result
-        self.album = self.release_data['release']['title']
-        # release date will always be in "YYYY-MM-DD" format, want date format to to be "Month DD, YYYY"
-        release_date = datetime.strptime(self.release_data['release']['date'], "%Y-%m-%d")
-        self.release_date = release_date.strftime("%B %d, %Y")
-        self.artists = self.release_data['release']['artist-credit-phrase']
-        self._set_tracks()
-        self._get_covers()
-
-    def _set_tracks(self):
-        # set track listing and add up the track lengths to get the album length
+            logger.debug(f"Could not find recording for {title} by {artists} on {album}")
+            return "", ""
+        recording = result['recording-list'][0]
+        for release in recording.get('release-list', []):
+            if release.get('status') == 'Official':
+                return recording['id'], release['id']
+        logger.debug(f"Could not find official release for {title} by {artists} on {album}")
+        return recording['id'], ""
+
+    def get_release(self, release_id):
+        '''Album data for a release MBID, from the cache when possible'''
+        release = self.cache.get_release(release_id) if self.cache else None
+        if release is not None:
+            return release
+        result = self._request(MB_HOST, musicbrainzngs.get_release_by_id, release_id,
+                               includes=["artists", "recordings", "media"])['release']
+        # add up the track lengths of every disc to get the album length
+        tracks = []
+        recordings = []
         album_length = 0
-        for track in self.release_data['release']['medium-list'][0]['track-list']:
-            album_length += int(track['length'])
-            self.tracks.append(track['recording']['title'])
-        self._set_album_duration(int(album_length / 1000))
-
-    def _get_covers(self):
-        if 'cover-art-archive' not in self.release_data['release']:
-            return
-        if self.release_data['release']['cover-art-archive']['front'] == 'true':
-            try:
-                self.front_cover = musicbrainzngs.get_image_front(self.release_id)
-                # save the front cover image to the album_images directory
-                logger.debug(f"Saving cover image to {self.art_path}{self.release_id}.jpg")
-                with open(f'{self.art_path}{self.release_id}.jpg', 'wb') as file:
-                    file.write(self.front_cover)
-            except:
-                self.front_cover = None
-        if self.release_data['release']['cover-art-archive']['back'] == 'true':
-            try:
-                self.back_cover = musicbrainzngs.get_image_back(self.release_id)
-            except:
-                self.back_cover = None
-
-    def get_album(self):
-        return self.album
-    
-    def get_artists(self):
-        return self.artists
-    
-    def get_title(self):
-        return self.title
-    
-    def get_album_duration(self):
-        return self.album_duration
-
-    def get_tracks(self):
-        return self.tracks
-    
-    def get_front_cover(self):
-        return self.front_cover
-    
-    def get_back_cover(self):
-        return self.back_cover
-    
-    def get_release_date(self):
-        return self.release_date
-    
-    def get_success(self):
-        return self.succeeded
-
-
-
-# if __name__ == "__main__":
-#     payload = {
-#         'album': 'TIME TRAVELLERS II',
-#         'artist': ['Jenova 7', 'Mr. Moods'],
-#         'title': 'Visions (Original Mix)',
-#         'duration': '4:42'
-#     }
-#     search = MusicBrainzSearch(
-#         payload['artist'],
-#         payload['album'],
-#         payload['title'],
-#         payload['duration']
-#     )
-#     print(json.dumps(search.recording_data, indent=4))
-#     print(json.dumps(search.release_data, indent=4))
+        for medium in result.get('medium-list', []):
+            for track in medium.get('track-list', []):
+                album_length += int(track.get('length') or 0)
+                tracks.append(track['recording']['title'])
+                recordings.append({"id": track['recording']['id'], "title": track['recording']['title']})
+        release = {
+            "release_id": release_id,
+            "album": result['title'],
+            "artists": result.get('artist-credit-phrase', ""),
+            "tracks": tracks,
+            "recordings": recordings,
+            "released": self._release_date(result.get('date', "")),
+            "duration": format_album_duration(album_length) if album_length else "",
+            "front": result.get('cover-art-archive', {}).get('front') == 'true',
+        }
+        if self.cache:
+            self.cache.put_release(release_id, release)
+        return dict(release)
 
+    def get_front_cover(self, release_id):
+        '''Download the front cover of a release into the art folder, returns the image data or None'''
+        path = os.path.join(self.art_path, f"{release_id}.jpg")
+        album_info = {"collectionId": release_id}
+        if self.store:
+            stored = self.store.find(release_id)
+            image_data = stored[0] if stored else self.store.adopt(album_info, path)
+            if image_data:
+                return image_data
+        elif os.path.exists(path):
+            with open(path, 'rb') as file:
+                image_data = file.read()
+            if is_valid_jpeg(image_data):
+                return image_data
+        try:
+            image_data = self._request(CAA_HOST, musicbrainzngs.get_image_front, release_id, size=CAA_SIZE)
+        except musicbrainzngs.WebServiceError as e:
+            logger.debug(f"No front cover for {release_id}: {e}")
+            return None
+        if not is_valid_jpeg(image_data):
+            # a PNG upload or a truncated download, the art folder only holds complete JPEGs
+            logger.debug(f"Front cover for {release_id} is not a complete JPEG, not saving it")
+            return None
+        logger.debug(f"Saving cover image to {path}")
+        if self.store:
+            self.store.save(image_data, album_info, path)
+            return image_data
+        atomic_write(path, image_data)
+        return image_data
@@ -39,8 +39,8 @@ class MusicDataStorage:
         track_data = []
         for track in tracks:
             track_data.append({
-                'album_id': track[1],
-                'album': track[2],
+                'album': track[1],
+                'album_id': track[2],
                 'artists': track[3],
                 'title': track[4],
                 'elapsed': track[5],
@@ -61,4 +61,25 @@ class MusicDataStorage:
                 'album': album[1],
                 'timestamp': album[2]
             })
-        return album_data
\ No newline at end of file
+        return album_data
+
+    def count_albums(self):
+        self.cursor.execute('''SELECT COUNT(*) FROM (SELECT 1 FROM music_data GROUP BY album, artists)''')
+        return self.cursor.fetchone()[0]
+
+    def iter_albums(self, batch_size=500):
+        # stream the distinct albums (with one of their titles) instead of loading the whole history
+        cursor = self.conn.cursor()
+        cursor.execute('''SELECT album, MAX(album_id), artists, MIN(title) FROM music_data
+                          GROUP BY album, artists ORDER BY MIN(id)''')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield {
+                    'album': row[0],
+                    'album_id': row[1],
+                    'artists': row[2],
+                    'title': row[3]
+                }
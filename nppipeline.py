@@ -0,0 +1,219 @@
+import itertools
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# pipeline stages, results are posted for each one as it completes
+STAGE_SEARCH = "search" # album info, or None if no album matched
+STAGE_ART = "art" # art prepared for the display, or None
+STAGE_TRACKS = "tracks" # album data dict with tracks, released and duration
+STAGES = (STAGE_SEARCH, STAGE_ART, STAGE_TRACKS)
+NO_ALBUM_DATA = {"tracks": [], "released": "", "duration": ""}
+FALLBACK_DELAY = 2.0 # seconds an Apple Music search runs alone before the fallback joins in
+
+
+class AlbumJob:
+    """One album lookup going through the pipeline"""
+    def __init__(self, job_id, meta, art_url, duration=""):
+        self.job_id = job_id
+        self.meta = meta
+        self.art_url = art_url # art provided by the client, used when no album matches
+        self.duration = duration # track duration as "m:ss", helps the fallback search
+        self.key = album_key(meta)
+        self.remaining = set(STAGES)
+        self.cancelled = Event()
+        self.fallback_start = Event() # set when Apple Music has no match, the fallback starts right away
+        self.fallback_stop = Event() # set once the fallback search isn't needed any more
+
+    def cancel(self):
+        self.cancelled.set()
+        self.fallback_stop.set()
+        self.fallback_start.set()
+
+
+def album_key(meta):
+    return (meta.artist.strip().lower(), meta.album.strip().lower())
+
+
+class AlbumFetchPipeline:
+    """
+    Fetches album art and data in the background so the display loop never waits on the network.
+    A job is searched first, then the art download (with decode and resize) and the track list
+    run concurrently. Every stage posts (job, stage, result) to the results queue as soon as it
+    completes, and the display thread applies them from there.
+    Lookups are deduplicated by album, so submitting an album that is already being fetched
+    returns the job in flight, and cancelled jobs stop at the next stage and post nothing.
+    The optional fallback provider (MusicBrainzSearch) is only searched when Apple Music has no
+    match, or joins the race when the Apple Music search takes longer than fallback_delay, so
+    albums Apple Music knows cost no MusicBrainz requests.
+    """
+    def __init__(self, finder, art_path, prepare_art, album_data, fallback=None, notify=None, workers=4,
+                 fallback_delay=FALLBACK_DELAY):
+        self.finder = finder
+        self.art_path = art_path
+        self.prepare_art = prepare_art # (album_id, image_data) -> display image
+        self.album_data = album_data # (album_url, album_id) -> album data dict
+        self.fallback = fallback
+        self.fallback_delay = fallback_delay
+        self.notify = notify # called after each result is posted, to wake the display
+        # a separate worker, so a search waiting on the fallback can never starve it of a thread
+        self.fallback_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fallback")
+        self.results = queue.Queue()
+        self.job_ids = itertools.count(1)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="album")
+        self.lock = Lock()
+        self.in_flight = {} # album key -> job
+
+    def submit(self, meta, art_url="", duration=""):
+        '''Start an album lookup, or return the one already running for the same album'''
+        with self.lock:
+            job = self.in_flight.get(album_key(meta))
+            if job is not None and not job.cancelled.is_set():
+                logger.debug(f"Album job {job.job_id} already running for {meta.artist} - {meta.album}")
+                return job
+            job = AlbumJob(next(self.job_ids), meta, art_url, duration)
+            self.in_flight[job.key] = job
+        logger.debug(f"Starting album job {job.job_id}: {meta.artist} - {meta.album}")
+        self.executor.submit(self._search, job)
+        return job
+
+    def cancel(self, job):
+        '''Stop a job at its next stage, the results of a cancelled job are never posted'''
+        if job is not None and not job.cancelled.is_set():
+            logger.debug(f"Cancelling album job {job.job_id}")
+            job.cancel()
+
+    def get_result(self, timeout=None):
+        '''Returns the next (job, stage, result), or None if nothing completed within the timeout'''
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _post(self, job, stage, result):
+        self._finish(job, stage)
+        if job.cancelled.is_set():
+            logger.debug(f"Dropping {stage} result of cancelled album job {job.job_id}")
+            return
+        self.results.put((job, stage, result))
+        if self.notify is not None:
+            self.notify()
+
+    def _finish(self, job, *stages):
+        with self.lock:
+            job.remaining.difference_update(stages)
+            if not job.remaining and self.in_flight.get(job.key) is job:
+                del self.in_flight[job.key]
+
+    def _search(self, job):
+        if job.cancelled.is_set():
+            self._finish(job, *STAGES)
+            return
+        fallback = self.fallback_executor.submit(self._fallback_search, job) if self.fallback else None
+        try:
+            found = self.finder.find(job.meta, self.art_path)
+        except Exception as e:
+            logger.error(f"Album search failed for job {job.job_id}: {e}")
+            found = None
+        if found is not None:
+            job.fallback_stop.set()
+            (art, album_info, image_data) = found
+            self._post(job, STAGE_SEARCH, album_info)
+            if job.cancelled.is_set():
+                self._finish(job, STAGE_ART, STAGE_TRACKS)
+                return
+            # the art and the track list don't depend on each other
+            self.executor.submit(self._art, job, art, album_info, image_data)
+            self.executor.submit(self._tracks, job, album_info)
+            return
+        job.fallback_start.set()
+        release = fallback.result() if fallback is not None else None
+        if release is None:
+            self._post(job, STAGE_SEARCH, None)
+            if job.art_url:
+                self.executor.submit(self._client_art, job)
+            else:
+                self._post(job, STAGE_ART, None)
+            self._post(job, STAGE_TRACKS, NO_ALBUM_DATA)
+            return
+        logger.debug(f"Using MusicBrainz release {release['release_id']} for job {job.job_id}")
+        album_info = {
+            "collectionId": release["release_id"],
+            "collectionName": release["album"],
+            "artistName": release["artists"],
+        }
+        self._post(job, STAGE_SEARCH, album_info)
+        if job.cancelled.is_set():
+            self._finish(job, STAGE_ART, STAGE_TRACKS)
+            return
+        self.executor.submit(self._fallback_art, job, release)
+        self._post(job, STAGE_TRACKS, {key: release[key] for key in NO_ALBUM_DATA})
+
+    def _fallback_search(self, job):
+        # wait for Apple Music to miss, or for its search to be slow
+        job.fallback_start.wait(self.fallback_delay)
+        if job.fallback_stop.is_set():
+            return None
+        try:
+            return self.fallback.search(job.meta.artist, job.meta.album, job.meta.title, job.duration,
+                                        stop=job.fallback_stop)
+        except Exception as e:
+            logger.error(f"MusicBrainz search failed for job {job.job_id}: {e}")
+            return None
+
+    def _art(self, job, art, album_info, image_data):
+        result = None
+        if job.cancelled.is_set():
+            self._finish(job, STAGE_ART)
+            return
+        try:
+            if image_data is None:
+                image_data = self.finder.fetch_art(job.meta, art, album_info, self.art_path)
+            if image_data:
+                result = self.prepare_art(album_info.get("collectionId"), image_data)
+        except Exception as e:
+            logger.error(f"Album art failed for job {job.job_id}: {e}")
+        self._post(job, STAGE_ART, result)
+
+    def _fallback_art(self, job, release):
+        if job.cancelled.is_set():
+            self._finish(job, STAGE_ART)
+            return
+        result = None
+        try:
+            image_data = self.fallback.get_front_cover(release["release_id"]) if release["front"] else None
+            if image_data:
+                result = self.prepare_art(release["release_id"], image_data)
+        except Exception as e:
+            logger.error(f"MusicBrainz album art failed for job {job.job_id}: {e}")
+        if result is None and job.art_url:
+            self._client_art(job)
+            return
+        self._post(job, STAGE_ART, result)
+
+    def _client_art(self, job):
+        result = None
+        if job.cancelled.is_set():
+            self._finish(job, STAGE_ART)
+            return
+        try:
+            image_data = self.finder.downloader._urlopen_safe(job.art_url)
+            result = self.prepare_art(None, image_data)
+        except Exception as e:
+            logger.error(f"Provided album art failed for job {job.job_id}: {e}")
+        self._post(job, STAGE_ART, result)
+
+    def _tracks(self, job, album_info):
+        if job.cancelled.is_set():
+            self._finish(job, STAGE_TRACKS)
+            return
+        try:
+            result = self.album_data(album_info.get("collectionViewUrl", ""), album_info.get("collectionId", ""))
+        except Exception as e:
+            logger.error(f"Album data failed for job {job.job_id}: {e}")
+            result = NO_ALBUM_DATA
+        self._post(job, STAGE_TRACKS, result)
@@ -0,0 +1,77 @@
+import time
+
+
+class PlaybackProgress:
+    """
+    Elapsed time and progress bar driven by a monotonic playback clock, shared by the display
+    backends. The display provides self.tk (with after and after_cancel), get_duration(),
+    _show_elapsed(text) and _show_progress(pixel), and calls _init_progress() when it's created.
+    """
+    def _init_progress(self, progress_length):
+        self.progress_length = progress_length # px
+        self.progress_pixel = -1 # pixels of the bar currently filled
+        self.playback_started = None # time.monotonic() at 0:00 of the current track
+        self.playing = False
+        self.progress_timer = None
+
+    def _time_to_seconds(self, time_str):
+        # Convert time string in mm:ss format to seconds
+        try:
+            minutes, seconds = map(int, str(time_str).split(':'))
+        except:
+            minutes, seconds = 0, 0
+        return minutes * 60 + seconds
+
+    def _update_progress_bar(self, elapsed):
+        # Convert elapsed and duration to seconds
+        elapsed_seconds = self._time_to_seconds(elapsed)
+        duration_seconds = self._time_to_seconds(self.get_duration())
+        self._set_progress(elapsed_seconds, duration_seconds)
+
+    def _set_progress(self, elapsed_seconds, duration_seconds):
+        # only redraw the bar when it moves by at least one pixel
+        if duration_seconds == 0:
+            pixel = 0
+        else:
+            pixel = int(self.progress_length * min(elapsed_seconds / duration_seconds, 1))
+        if pixel != self.progress_pixel:
+            self.progress_pixel = pixel
+            self._show_progress(pixel)
+
+    def _format_elapsed(self, elapsed_seconds):
+        return f"{elapsed_seconds // 60}:{elapsed_seconds % 60:02d}"
+
+    def set_playback(self, started, playing):
+        '''Follow the playback clock, started is the time.monotonic() of 0:00 in the current track.
+        While playing, the elapsed time and progress bar keep moving on their own.'''
+        self.playback_started = started
+        self.playing = playing
+        self._update_playback()
+
+    def _update_playback(self):
+        if self.progress_timer is not None:
+            self.tk.after_cancel(self.progress_timer)
+            self.progress_timer = None
+        if self.playback_started is None:
+            return
+        duration_seconds = self._time_to_seconds(self.get_duration())
+        elapsed = max(time.monotonic() - self.playback_started, 0)
+        if duration_seconds:
+            elapsed = min(elapsed, duration_seconds)
+        self._show_elapsed(self._format_elapsed(int(elapsed)))
+        self._set_progress(elapsed, duration_seconds)
+        if not self.playing or elapsed >= duration_seconds:
+            return
+        # wake up for whichever comes first, the next pixel of the bar or the next second of the label
+        next_second = int(elapsed) + 1 - elapsed
+        next_pixel = (self.progress_pixel + 1) * duration_seconds / self.progress_length - elapsed
+        delay = min(next_second, max(next_pixel, 0))
+        self.progress_timer = self.tk.after(max(int(delay * 1000) + 1, 10), self._update_playback)
+
+    def set_elapsed(self, new_elapsed):
+        # a fixed elapsed time stops the playback clock
+        self.playback_started = None
+        self._update_playback()
+        self._show_elapsed(new_elapsed)
+        # update progress bar with new elapsed time
+        self._update_progress_bar(new_elapsed)
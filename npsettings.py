@@ -8,7 +8,14 @@ screensaver_delay = 180
 # whether to enable debug logging... it's quite verbose
 DEBUG = False
 
+# memory for keeping the art of recently played albums ready to show, about 5MB per album at 720p
+artwork_cache_mb = 64
+
 # these are the fonts that are used in the UI, they need to be installed on the system
 # and can also be changed to other fonts if desired
 primary_fontname = "VL PGothic"
-header_fontname = "Droid Sans Fallback"
\ No newline at end of file
+header_fontname = "Droid Sans Fallback"
+
+# font files for the headless display (--headless), Pillow looks them up in the system font folders
+framebuffer_font = "DejaVuSans.ttf"
+framebuffer_bold_font = "DejaVuSans-Bold.ttf"
@@ -0,0 +1,74 @@
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+
+# npstartup.py records a timeline of startup when now_playing.py is run with --profile-startup:
+# every top level import with how long it took, and the marks placed at each initialization step
+# up to the first frame on the screen. Import it before anything else so the imports are timed.
+
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+
+_start = time.perf_counter()
+_events = [] # (seconds since start, duration or None, label)
+_local = threading.local()
+_original_import = builtins.__import__
+
+
+def _module_name(name, importer_globals, level):
+    '''The full name of an import, relative ones (from . import x) are resolved against the importing package'''
+    if level <= 0:
+        return name
+    importer_globals = importer_globals or {}
+    package = importer_globals.get("__package__") or importer_globals.get("__name__", "")
+    try:
+        return importlib.util.resolve_name("." * level + name, package)
+    except (ImportError, ValueError):
+        return name
+
+
+def _timed_import(name, importer_globals=None, importer_locals=None, fromlist=(), level=0):
+    args = (name, importer_globals, importer_locals, fromlist, level)
+    module_name = _module_name(name, importer_globals, level)
+    depth = getattr(_local, "depth", 0)
+    if depth or module_name in sys.modules:
+        # only time the outermost import, nested ones are part of its duration
+        _local.depth = depth + 1
+        try:
+            return _original_import(*args)
+        finally:
+            _local.depth = depth
+    _local.depth = 1
+    start = time.perf_counter()
+    try:
+        return _original_import(*args)
+    finally:
+        _local.depth = 0
+        _events.append((start - _start, time.perf_counter() - start, f"import {module_name} ({threading.current_thread().name})"))
+
+
+def mark(label):
+    '''Add a step to the startup timeline'''
+    if PROFILE_STARTUP:
+        _events.append((time.perf_counter() - _start, None, label))
+
+
+def report():
+    '''Print the startup timeline and stop timing imports'''
+    if not PROFILE_STARTUP:
+        return
+    builtins.__import__ = _original_import
+    print(f"Startup timeline (--profile-startup), {len(_events)} events")
+    print(f"{'at ms':>9} {'took ms':>9}  event")
+    for (at, duration, label) in sorted(_events, key=lambda event: event[0]):
+        took = f"{duration * 1000:9.1f}" if duration is not None else " " * 9
+        print(f"{at * 1000:9.1f} {took}  {label}")
+    slowest = sorted((event for event in _events if event[1] is not None), key=lambda event: -event[1])[:5]
+    if slowest:
+        print("slowest imports: " + ", ".join(f"{label[7:].split(' ')[0]} {duration * 1000:.0f}ms"
+                                                for (_at, duration, label) in slowest))
+
+
+if PROFILE_STARTUP:
+    builtins.__import__ = _timed_import
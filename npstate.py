@@ -1,3 +1,4 @@
+import re
 import time
 from npmusicdata import MusicDataStorage
 
@@ -24,9 +25,9 @@ class NowPlayingState:
         self.debug = False
         self.last_update_time = time.time()-60 # clients
         self.last_track_elapsed = 0
-        self.api_payloads = [self.get_empty_payload()]
+        self.api_payloads = [] # queued by the API, update_display() applies one per payload
         self.last_payload = self.get_empty_payload()
-        self.epoc_start = time.time()  # Track the time the album started
+        self.epoc_start = time.monotonic()  # Track the time the track started
 
     def set_last_update_time(self):
         self.last_update_time = time.time()
@@ -77,9 +78,8 @@ class NowPlayingState:
         self.track = track
 
     def set_elapsed(self, elapsed):
-        current_time = int(time.time())
-        # get the time the album started
-        self.epoc_start = current_time - self._time_to_seconds(elapsed)
+        # get the time the track started, monotonic so clock changes don't move the progress
+        self.epoc_start = time.monotonic() - self._time_to_seconds(elapsed)
         self.elapsed = elapsed
         return
 
@@ -157,7 +157,7 @@ class NowPlayingState:
     def get_epoc_elapsed(self):
         # Get the elapsed time using epoc and add 2 seconds of delay
         try:
-            total_elapsed_seconds = int(time.time() - self.get_epoc_start())
+            total_elapsed_seconds = int(time.monotonic() - self.get_epoc_start())
         except:
             total_elapsed_seconds = 0
         elapsed_minutes = total_elapsed_seconds // 60
@@ -258,3 +258,34 @@ class NowPlayingState:
 
     def get_previous_state(self):
         return self.previous_state
+
+    def current_track(self):
+        ''' Get the current track number out of the list of tracks '''
+        if len(self.tracks) == 0:
+            return ""
+
+        # use fuzzy to match the current track to the list of tracks
+        from thefuzz import process
+        track = process.extractOne(self.title, self.tracks)
+        if track is not None:
+            # get the index of the track in the list of tracks
+            index = self.tracks.index(track[0]) + 1
+            return f"{index} of {len(self.tracks)}"
+
+        # old method of matching tracks, will be removed in the future if fuzzy matching works well
+        title = self.title.lower()
+        for index, name in enumerate(self.tracks, start=1):
+            if name.lower() == title:
+                return f"{index} of {len(self.tracks)}"
+            if name.lower() in title:
+                return f"{index} of {len(self.tracks)}"
+            if strip_paren_words(name.lower()) == strip_paren_words(title):
+                return f"{index} of {len(self.tracks)}"
+
+        return f"? of {len(self.tracks)}"
+
+
+def strip_paren_words(value: str) -> str:
+    '''Remove words in parentesis from the string'''
+    result = re.sub(r'\([^)]*\)', '', value)
+    return result.strip()
@@ -27,7 +27,7 @@ def check_xrandr():
     try:
         output = subprocess.check_output(['xrandr'], universal_newlines=True)
         return True
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, OSError):
         logger.error("Error: Unable to execute xrandr command.")
         return False
 
@@ -1,15 +1,77 @@
 import os
 import time
 import random
-import pygame
 import math
 from threading import Thread
 import logging
+from collections import OrderedDict, deque
 from nputils import display_on, check_xrandr
+from npart import ArtDerivatives, screensaver_tile_size
 
 logging.basicConfig(level=logging.INFO)
 logger=logging.getLogger(__name__)
 
+pygame = None # imported when the screensaver first runs, it's slow to load and often never needed
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+PREFETCH = 8 # images picked ahead of time and decoded between grid updates
+RANDOM_TRIES = 8 # random picks tried before scanning the whole library for an image not on the screen
+
+
+def _import_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as pygame_module
+        pygame = pygame_module
+
+class ScreensaverImages:
+    """
+    The album art for the screensaver, loaded as it's needed. Starting only lists the file
+    names, an image is decoded when it's about to go on the grid, from the tile sized copy
+    in album_images/derived/ (made the first time an album is shown), and only the images
+    on the grid and the ones picked ahead of time are kept. Memory follows the grid size,
+    not the number of albums.
+    """
+    def __init__(self, folder_path, image_size, cache_size):
+        self.folder_path = folder_path
+        self.image_size = image_size
+        self.cache_size = cache_size
+        self.derivatives = ArtDerivatives(folder_path, tile_size=image_size)
+        with os.scandir(folder_path) as entries:
+            self.names = sorted(entry.name for entry in entries
+                                if entry.name.endswith(IMAGE_EXTENSIONS) and entry.is_file())
+        self.surfaces = OrderedDict() # name -> scaled surface, least recently used first
+        self.loads = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.surfaces
+
+    def get(self, name):
+        '''The tile sized surface for an image, decoded if it isn't loaded'''
+        surface = self.surfaces.get(name)
+        if surface is not None:
+            self.surfaces.move_to_end(name)
+            return surface
+        surface = self._load(name)
+        self.surfaces[name] = surface
+        while len(self.surfaces) > self.cache_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def _load(self, name):
+        (album_id, ext) = os.path.splitext(name)
+        # load the pre-sized tiles instead of the full size originals where possible
+        tile_path = self.derivatives.get(album_id, "tile") if ext == ".jpg" else None
+        image = pygame.image.load(tile_path or os.path.join(self.folder_path, name))
+        self.loads += 1
+        if image.get_size() == (self.image_size, self.image_size):
+            return image
+        return pygame.transform.smoothscale(image, (self.image_size, self.image_size))
+
+
 class AlbumArtScreensaver:
     running = False # only one instance of the screensaver can run at a time
     def __init__(self, debug=False):
@@ -23,12 +85,13 @@ class AlbumArtScreensaver:
         self.lockfile_path = f"{self.dir}/screensaver.lock"
         self.image_map = {}
         self.used_images = set()
+        self.images = None # ScreensaverImages while the screensaver runs
+        self.upcoming = deque() # images picked for the next grid updates
         self.screensaver_thread = None
         if check_xrandr(): # if the system has xrandr, then enable checking for display power
             self.display_check = True
         else:
             self.display_check = False
-        pygame.init()
 
     def stop(self):
         if os.path.exists(self.lockfile_path):
@@ -50,18 +113,40 @@ class AlbumArtScreensaver:
     def get_start_time(self):
         return self.start_time
 
-    def _load_images(self, folder_path):
-        image_files = [f for f in os.listdir(folder_path) if f.endswith(('.jpg', '.jpeg', '.png', '.gif'))]
-        image_files.sort()
-        return [pygame.image.load(os.path.join(folder_path, image_file)) for image_file in image_files]
+    def _load_images(self, folder_path, image_size, grid_cells):
+        # room for every grid square, the images picked ahead and the ones they replace
+        return ScreensaverImages(folder_path, image_size, cache_size=grid_cells + 2 * PREFETCH)
 
     def _select_random_image(self, images):
+        # with a large library a few random picks find one that isn't on the screen,
+        # the full scan is only needed when most of the images are already showing
+        for _ in range(RANDOM_TRIES):
+            image = random.choice(images)
+            if image not in self.used_images:
+                return image
         remaining_images = [image for image in images if image not in self.used_images]
         if remaining_images:
             return random.choice(remaining_images)
         else:
             return random.choice(images)
 
+    def _next_image(self, images):
+        # take the images picked ahead of time first, they are already decoded
+        while self.upcoming:
+            image = self.upcoming.popleft()
+            if image not in self.used_images:
+                return image
+        return self._select_random_image(images)
+
+    def _prefetch(self, images):
+        # pick the images for the next updates and decode one of them, called between updates
+        while len(self.upcoming) < min(PREFETCH, len(images)):
+            self.upcoming.append(self._select_random_image(images))
+        for image in self.upcoming:
+            if image not in self.images:
+                self.images.get(image)
+                return
+
     def _simplify_ratio(self, a, b):
         # Calculate the greatest common divisor (GCD) and simplify the ratio
         gcd = math.gcd(a, b)    
@@ -73,9 +158,9 @@ class AlbumArtScreensaver:
         for i in range(len(grid)):
             for j in range(len(grid[i])):
                 if random.random() < 0.05:  # 5% chance of updating each cell
-                    image = self._select_random_image(images)
+                    image = self._next_image(images)
                     self.used_images.add(image)
-                    grid[i][j] = pygame.transform.smoothscale(image, (image_size, image_size))
+                    grid[i][j] = self.images.get(image)
                     self.used_images.remove(image_map.get(f"{i}/{j}"))
                     image_map[f"{i}/{j}"] = image
         # Draw the updated grid
@@ -91,6 +176,8 @@ class AlbumArtScreensaver:
             logger.debug("Screensaver already running.")
             return
         AlbumArtScreensaver.running = True
+        _import_pygame()
+        pygame.init()
         logger.debug("Building screensaver grid...")
         display_info = pygame.display.Info()
         screen_width = display_info.current_w
@@ -98,21 +185,26 @@ class AlbumArtScreensaver:
         grid_size = self._simplify_ratio(screen_width, screen_height)
         logger.debug(f"grid size: {grid_size} from {screen_width}x{screen_height}")
 
-        # Load images
-        logger.debug("Loading album art...")
+        image_size = screensaver_tile_size(screen_width, screen_height)
+
+        # List the album art, images are decoded as they go on the grid
+        logger.debug("Listing album art...")
         art_path = f'{self.dir}/album_images/'
-        images = self._load_images(art_path)
+        self.images = self._load_images(art_path, image_size, grid_size[0] * grid_size[1])
+        images = self.images.names
+        self.used_images = set()
+        self.image_map = {}
+        self.upcoming.clear()
+        logger.debug(f"{len(images)} images of album art")
 
         # Create the grid
-        logger.debug("Creating grid and resizing images...")
+        logger.debug("Creating grid and loading images...")
         grid = [[None] * grid_size[0] for _ in range(grid_size[1])]
-        image_size = min(screen_width // grid_size[0], screen_height // grid_size[1])
         for i in range(len(grid)):
             for j in range(len(grid[i])):
                 image = self._select_random_image(images)
                 self.used_images.add(image)
-                resized_image = pygame.transform.smoothscale(image, (image_size, image_size))
-                grid[i][j] = resized_image
+                grid[i][j] = self.images.get(image)
                 self.image_map[f"{i}/{j}"] = image
 
         # Set up the display
@@ -130,6 +222,8 @@ class AlbumArtScreensaver:
                 self.update_time = time.time()
                 new_image_map = self._update_grid(window, self.image_map.copy(), grid, images, image_size)
                 self.image_map = new_image_map.copy()
+            else:
+                self._prefetch(images)
             clock.tick(5)
 
         logger.debug(f"Quitting screensaver at {time.ctime()}...")
@@ -139,6 +233,9 @@ class AlbumArtScreensaver:
             while not display_on():
                 time.sleep(1)
         pygame.quit()
+        # let go of the surfaces until the next time
+        self.images = None
+        self.upcoming.clear()
         AlbumArtScreensaver.running = False
         logger.debug("Screensaver successfully stopped.")
 